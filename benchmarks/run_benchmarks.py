@@ -0,0 +1,484 @@
+"""Reproducible benchmark suite for the hot paths of the utility modules: resample_volume, remove_zeros_ijk_from_volume,
+dicom series reading, the utils_np checks, the list set operations, the top-n counters, date detection and the
+column-level string normalization.
+
+All inputs (NIfTI volumes, a DICOM series, lists and strings) are generated locally with fixed seeds. Each case is run
+once as warm-up, then timed `--repeats` times, then run once more with tracemalloc to record the peak memory allocated
+by Python/numpy (memory allocated inside SimpleITK is not visible to tracemalloc). Results are saved as json; if a
+baseline json is given, the cases whose median time grew more than `--threshold` are flagged and the exit code is 1.
+
+Optimized code paths are paired with a reference case that runs the implementation they replace (e.g. in-memory vs
+disk-based resampling, multi_list_set_operation vs find_common_elements), and the speedup of each pair is reported.
+
+Usage:
+    python benchmarks/run_benchmarks.py --out baseline.json
+    python benchmarks/run_benchmarks.py --out new.json --baseline baseline.json --threshold 0.2
+    python benchmarks/run_benchmarks.py --quick --only utils_np  # small inputs, only the cases whose name contains utils_np
+"""
+import os
+import sys
+import json
+import random
+import string
+import shutil
+import platform
+import argparse
+import tempfile
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+for module_dir in ("lists", "strings", "numpy", "numeric", "nifti_and_dicom"):
+    sys.path.insert(0, os.path.join(REPO_DIR, module_dir))
+
+import numpy as np  # noqa: E402
+import nibabel as nib  # noqa: E402
+import SimpleITK as sitk  # noqa: E402
+import utils_lists  # noqa: E402
+import utils_strings  # noqa: E402
+import utils_np  # noqa: E402
+import utils_nifti_and_dicom  # noqa: E402
+from timing_utils import SpanProfiler  # noqa: E402
+
+
+def make_synthetic_volume(shape: Tuple[int, int, int], dtype: str, seed: int = 123) -> np.ndarray:
+    """This function generates a volume with random values inside a central block and zeros around it (like a
+    skull-stripped brain), so that cropping has something to remove
+    Args:
+        shape (tuple): shape of the volume
+        dtype (str): numpy dtype of the volume
+        seed (int): random seed to use; defaults to 123
+    Returns:
+        volume (np.ndarray): synthetic volume
+    """
+    rng = np.random.default_rng(seed)
+    volume = np.zeros(shape, dtype=dtype)
+    block = tuple(slice(dim // 6, dim - dim // 5) for dim in shape)
+    block_shape = tuple(sl.stop - sl.start for sl in block)
+    volume[block] = (rng.random(block_shape) * 1000 + 1).astype(dtype)
+
+    return volume
+
+
+def make_synthetic_nifti(out_path: str, shape: Tuple[int, int, int], dtype: str, spacing: Tuple[float, float, float], seed: int = 123) -> str:
+    """This function saves a synthetic volume (see make_synthetic_volume) as nifti file with the given voxel spacing
+    Args:
+        out_path (str): path of the output nifti file
+        shape (tuple): shape of the volume
+        dtype (str): numpy dtype of the volume
+        spacing (tuple): voxel spacing in mm
+        seed (int): random seed to use; defaults to 123
+    Returns:
+        out_path (str): path of the saved nifti file
+    """
+    volume = make_synthetic_volume(shape, dtype, seed)
+    nib.save(nib.Nifti1Image(volume, np.diag(list(spacing) + [1.])), out_path)
+
+    return out_path
+
+
+def make_synthetic_dcm_series(out_dir: str, shape: Tuple[int, int, int], spacing: Tuple[float, float, float], seed: int = 123) -> str:
+    """This function writes a synthetic volume as a single-series dicom directory (one file per slice)
+    Args:
+        out_dir (str): output directory
+        shape (tuple): shape of the volume as (rows, columns, slices)
+        spacing (tuple): voxel spacing in mm
+        seed (int): random seed to use; defaults to 123
+    Returns:
+        out_dir (str): directory containing the dicom series
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    volume = make_synthetic_volume(shape, "int16", seed)
+    series_uid = "1.2.826.0.1.3680043.2.1125.{}".format(seed)
+    writer = sitk.ImageFileWriter()
+    writer.KeepOriginalImageUIDOn()
+    for slice_idx in range(shape[2]):
+        dcm_slice = sitk.GetImageFromArray(volume[np.newaxis, :, :, slice_idx])  # 3D image with one slice, so that
+        dcm_slice.SetSpacing(spacing)  # the writer fills SpacingBetweenSlices with the slice spacing
+        tags = {"0008|0060": "MR",
+                "0008|103e": "synthetic benchmark series",
+                "0020|000d": series_uid + ".1",
+                "0020|000e": series_uid,
+                "0008|0018": "{}.{}".format(series_uid, slice_idx + 1),
+                "0020|0013": str(slice_idx + 1),
+                "0020|0032": "0\\0\\{}".format(slice_idx * spacing[2]),
+                "0020|0037": "1\\0\\0\\0\\1\\0",
+                "0018|0050": str(spacing[2]),
+                "0028|0030": "{}\\{}".format(spacing[1], spacing[0])}
+        for tag, value in tags.items():
+            dcm_slice.SetMetaData(tag, value)
+        writer.SetFileName(os.path.join(out_dir, "slice_{:04d}.dcm".format(slice_idx)))
+        writer.Execute(dcm_slice)
+
+    return out_dir
+
+
+def make_random_strings(nb_items: int, length: int = 12, seed: int = 123) -> List[str]:
+    """This function generates random lowercase strings
+    Args:
+        nb_items (int): number of strings
+        length (int): length of each string; defaults to 12
+        seed (int): random seed to use; defaults to 123
+    Returns:
+        strings (list): generated strings
+    """
+    rng = random.Random(seed)
+    strings = ["".join(rng.choices(string.ascii_lowercase, k=length)) for _ in range(nb_items)]
+
+    return strings
+
+
+def make_date_fields(nb_items: int, nb_distinct: int, seed: int = 123) -> List[str]:
+    """This function generates a mix of DICOM dates/times, ISO dates and non-date strings, with repetitions (like the
+    fields of a real DICOM/csv dump)
+    Args:
+        nb_items (int): number of strings
+        nb_distinct (int): number of distinct strings
+        seed (int): random seed to use; defaults to 123
+    Returns:
+        fields (list): generated strings
+    """
+    rng = random.Random(seed)
+    generators = [lambda: "{:04d}{:02d}{:02d}".format(rng.randrange(1950, 2030), rng.randrange(1, 13), rng.randrange(1, 29)),
+                  lambda: "{:02d}{:02d}{:02d}.{:06d}".format(rng.randrange(24), rng.randrange(60), rng.randrange(60), rng.randrange(10**6)),
+                  lambda: "{:04d}-{:02d}-{:02d}".format(rng.randrange(1950, 2030), rng.randrange(1, 13), rng.randrange(1, 29)),
+                  lambda: rng.choice(["T1w", "FLAIR", "SIEMENS", "HEAD_NECK"]) + str(rng.randrange(1000))]
+    distinct_fields = [rng.choice(generators)() for _ in range(nb_distinct)]
+    fields = rng.choices(distinct_fields, k=nb_items)
+
+    return fields
+
+
+def make_zipf_items(nb_items: int, nb_distinct: int, seed: int = 123) -> List[int]:
+    """This function generates a list of integer items whose frequencies follow a Zipf-like distribution
+    Args:
+        nb_items (int): number of items
+        nb_distinct (int): number of distinct items
+        seed (int): random seed to use; defaults to 123
+    Returns:
+        items (list): generated items
+    """
+    weights = [1 / rank for rank in range(1, nb_distinct + 1)]
+    items = random.Random(seed).choices(range(nb_distinct), weights=weights, k=nb_items)
+
+    return items
+
+
+def make_subject_ids(nb_items: int, seed: int = 123) -> List[str]:
+    """This function generates a list of subject IDs like the ones found in csv files (e.g. 'sub-0042_ses-1')
+    Args:
+        nb_items (int): number of IDs
+        seed (int): random seed to use; defaults to 123
+    Returns:
+        subject_ids (list): generated IDs
+    """
+    rng = random.Random(seed)
+    subject_ids = ["sub-{:04d}_ses-{}".format(rng.randrange(10000), rng.randrange(1, 4)) for _ in range(nb_items)]
+
+    return subject_ids
+
+
+def separate_array_checks(input_array: np.ndarray, low: float, high: float) -> Dict[str, bool]:
+    """This function computes the same properties as utils_np.validate_array with one full-array numpy expression per
+    check, like the utils_np helpers did before validate_array; it's the reference of the validate_array cases
+    Args:
+        input_array (np.ndarray): input array that we want to inspect
+        low (float): lower bound of the range check
+        high (float): upper bound of the range check
+    Returns:
+        results (dict): outcome of each check
+    """
+    results = {"has_nans": bool(np.isnan(np.sum(input_array))),
+               "has_infs": bool(np.isinf(input_array).any()),
+               "is_binary": np.array_equal(input_array, input_array.astype(bool)),
+               "all_in_range": bool(np.all((input_array > low) & (input_array < high)))}
+
+    return results
+
+
+def per_slice_remove_zeros_ijk(input_volume: np.ndarray) -> np.ndarray:
+    """This function removes the rows, columns and slices of a 3D volume that only contain zeros with one
+    np.count_nonzero per slice, like remove_zeros_ijk_from_volume did before crop_volume_to_nonzero_bbox; it's the
+    reference of the cropping cases
+    Args:
+        input_volume (np.ndarray): 3D volume that we want to crop
+    Returns:
+        cropped_volume (np.ndarray): input volume without the all-zero rows, columns and slices
+    """
+    cropped_volume = input_volume
+    for axis in range(3):
+        idxs_nonzero_slices = [idx for idx in range(cropped_volume.shape[axis])
+                               if np.count_nonzero(np.take(cropped_volume, idx, axis=axis)) > 0]
+        cropped_volume = np.take(cropped_volume, idxs_nonzero_slices, axis=axis)
+
+    return cropped_volume
+
+
+def unique_most_frequent_value(input_array: np.ndarray):
+    """This function finds the most frequent value of an array with np.unique(return_counts=True), like
+    find_most_frequent_value did before the bincount and chunked counting; it's the reference of its cases
+    Args:
+        input_array (np.ndarray): input array
+    Returns:
+        most_frequent_value: most frequent value
+    """
+    values, counts = np.unique(input_array, return_counts=True)
+    most_frequent_value = values[np.argmax(counts)]
+
+    return most_frequent_value
+
+
+def iter_benchmark_cases(tmp_dir: str, quick: bool) -> Iterator[Tuple[str, Callable, Optional[str]]]:
+    """This function generates the synthetic inputs and yields the benchmark cases. Inputs are created lazily,
+    one group at a time, so that only the inputs of the running cases are in memory
+    Args:
+        tmp_dir (str): directory where the synthetic nifti/dicom files are written
+        quick (bool): if True, only small inputs are used (useful to check that the suite runs)
+    Yields:
+        case_name (str): unique name of the case, including its parameters
+        fn (Callable): function without arguments that runs the case
+        reference_name (str): name of the case that runs the implementation replaced by this one (it's always yielded
+            before); None if the case has no reference
+    """
+    volume_shapes = [(64, 64, 32)] if quick else [(128, 128, 64), (256, 256, 128)]
+    for shape in volume_shapes:
+        shape_str = "x".join(map(str, shape))
+        for dtype in ("float32", "int16"):
+            nii_path = make_synthetic_nifti(os.path.join(tmp_dir, "vol_{}_{}.nii.gz".format(shape_str, dtype)), shape, dtype, (0.8, 0.8, 1.5))
+            params = "shape={},dtype={}".format(shape_str, dtype)
+            out_path = os.path.join(tmp_dir, "resampled_{}_{}.nii.gz".format(shape_str, dtype))
+            disk_name = "utils_nifti_and_dicom.resample_volume[{},in_memory=False]".format(params)
+            yield (disk_name,
+                   lambda path=nii_path, out=out_path: utils_nifti_and_dicom.resample_volume(path, [1., 1., 1.], out_path=out), None)
+            yield ("utils_nifti_and_dicom.resample_volume[{},in_memory=True]".format(params),
+                   lambda path=nii_path: utils_nifti_and_dicom.resample_volume(path, [1., 1., 1.], in_memory=True), disk_name)
+            volume = make_synthetic_volume(shape, dtype)
+            per_slice_name = "per_slice_remove_zeros_ijk[{}]".format(params)
+            yield per_slice_name, lambda vol=volume: per_slice_remove_zeros_ijk(vol), None
+            yield ("utils_nifti_and_dicom.remove_zeros_ijk_from_volume[{}]".format(params),
+                   lambda vol=volume: utils_nifti_and_dicom.remove_zeros_ijk_from_volume(vol), per_slice_name)
+            yield ("utils_nifti_and_dicom.crop_volume_to_nonzero_bbox[{}]".format(params),
+                   lambda vol=volume: utils_nifti_and_dicom.crop_volume_to_nonzero_bbox(vol), per_slice_name)
+
+        dcm_dir = make_synthetic_dcm_series(os.path.join(tmp_dir, "dcm_{}".format(shape_str)), shape, (0.8, 0.8, 1.5))
+        yield ("utils_nifti_and_dicom.read_dcm_series[shape={}]".format(shape_str),
+               lambda path=dcm_dir: utils_nifti_and_dicom.read_dcm_series(path), None)
+        full_read_name = "utils_nifti_and_dicom.get_sitk_volume_info[shape={},header_only=False]".format(shape_str)
+        yield full_read_name, lambda path=dcm_dir: utils_nifti_and_dicom.get_sitk_volume_info(path), None
+        yield ("utils_nifti_and_dicom.get_sitk_volume_info[shape={},header_only=True]".format(shape_str),
+               lambda path=dcm_dir: utils_nifti_and_dicom.get_sitk_volume_info(path, header_only=True), full_read_name)
+        yield ("utils_nifti_and_dicom.get_sitk_volume_info[shape={},header_only=True,estimate=True]".format(shape_str),
+               lambda path=dcm_dir: utils_nifti_and_dicom.get_sitk_volume_info(path, header_only=True, estimate=True), full_read_name)
+
+    array_sizes = [10**6] if quick else [10**6, 10**7]
+    for size in array_sizes:
+        for dtype in ("float32", "float64", "uint8", "int16"):
+            array = np.random.default_rng(123).integers(0, 2, size).astype(dtype)  # binary, so that no check stops early
+            params = "size={},dtype={}".format(size, dtype)
+            separate_name = "separate_array_checks[{}]".format(params)
+            yield separate_name, lambda arr=array: separate_array_checks(arr, low=0, high=1), None
+            yield "utils_np.validate_array[{}]".format(params), lambda arr=array: utils_np.validate_array(arr, low=0, high=1), separate_name
+            yield "utils_np.has_nans[{}]".format(params), lambda arr=array: utils_np.has_nans(arr), None
+            yield "utils_np.is_binary[{}]".format(params), lambda arr=array: utils_np.is_binary(arr), None
+            yield "utils_np.has_values_all_in_range[{}]".format(params), lambda arr=array: utils_np.has_values_all_in_range(arr, 0, 1), None
+            unique_name = "unique_most_frequent_value[{}]".format(params)
+            yield unique_name, lambda arr=array: unique_most_frequent_value(arr), None
+            yield "utils_np.find_most_frequent_value[{}]".format(params), lambda arr=array: utils_np.find_most_frequent_value(arr), unique_name
+
+    # the previous two-list helpers, with the input shapes they accept
+    def concatenate(lsts):
+        return np.concatenate(lsts) if isinstance(lsts[0], np.ndarray) else lsts[0] + lsts[1]
+    set_operation_references = {"intersection": ("find_common_elements", lambda lsts: utils_lists.find_common_elements(lsts[0], lsts[1])),
+                                "difference": ("find_difference_list", lambda lsts: utils_lists.find_difference_list(lsts[0], lsts[1])),
+                                "unique": ("extract_unique_elements", lambda lsts: utils_lists.extract_unique_elements(concatenate(lsts))),
+                                "duplicates": ("keep_only_duplicates", lambda lsts: utils_lists.keep_only_duplicates(concatenate(lsts)))}
+    list_sizes = [10**5] if quick else [10**5, 10**6]
+    for size in list_sizes:
+        rng = np.random.default_rng(123)
+        int_lists = [rng.integers(0, size, size).tolist() for _ in range(2)]
+        str_lists = [make_random_strings(size, length=4, seed=seed) for seed in range(2)]
+        # the same values as lists and as 1D arrays (numeric arrays take the numpy path)
+        inputs = [("int", int_lists), ("str", str_lists),
+                  ("int_array", [np.array(lst) for lst in int_lists]), ("str_array", [np.array(lst) for lst in str_lists])]
+        for item_type, lists in inputs:
+            params = "size={},type={},nb_lists=2".format(size, item_type)
+            for operation in utils_lists.SET_OPERATIONS:
+                reference_fn_name, reference_fn = set_operation_references[operation]
+                reference_name = "utils_lists.{}[{}]".format(reference_fn_name, params)
+                yield reference_name, lambda lsts=lists, fn=reference_fn: fn(lsts), None
+                yield ("utils_lists.multi_list_set_operation[{},operation={}]".format(params, operation),
+                       lambda lsts=lists, op=operation: utils_lists.multi_list_set_operation(lsts, op), reference_name)
+                if isinstance(lists[0], list):  # arrays are sorted by default
+                    yield ("utils_lists.multi_list_set_operation[{},operation={},sort=True]".format(params, operation),
+                           lambda lsts=lists, op=operation: utils_lists.multi_list_set_operation(lsts, op, sort=True), reference_name)
+
+        items = make_zipf_items(10 * size, nb_distinct=size)
+        params = "size={},distinct={},n=10".format(10 * size, size)
+        counter_name = "utils_lists.most_frequent_n_elements[{}]".format(params)
+        yield counter_name, lambda itms=items: utils_lists.most_frequent_n_elements(itms, 10), None
+        yield ("utils_lists.most_frequent_n_elements_streaming[{},exact]".format(params),
+               lambda itms=items: utils_lists.most_frequent_n_elements_streaming(iter(itms), 10), counter_name)
+        yield ("utils_lists.most_frequent_n_elements_streaming[{},exact,workers=4]".format(params),
+               lambda itms=items: utils_lists.most_frequent_n_elements_streaming(iter(itms), 10, workers=4), counter_name)
+        yield ("utils_lists.most_frequent_n_elements_streaming[{},approximate,epsilon=1e-3]".format(params),
+               lambda itms=items: utils_lists.most_frequent_n_elements_streaming(iter(itms), 10, approximate=True, epsilon=1e-3), counter_name)
+
+    date_sizes = [10**4] if quick else [10**4, 10**5]
+    for size in date_sizes:
+        for nb_distinct in (size // 10, size):  # many repetitions vs all distinct values
+            fields = make_date_fields(size, nb_distinct)
+            params = "size={},distinct={}".format(size, nb_distinct)
+            is_date_name = "utils_strings.is_date[{}]".format(params)
+            yield is_date_name, lambda flds=fields: [utils_strings.is_date(field) for field in flds], None
+
+            def detect_dates_cold_cache(flds=fields):
+                utils_strings._is_date_cached.cache_clear()  # otherwise every repeat after the first would only hit the cache
+                return utils_strings.detect_dates(flds)
+            yield "utils_strings.detect_dates[{}]".format(params), detect_dates_cold_cache, is_date_name
+
+    try:
+        import pandas as pd
+    except ImportError:
+        pd = None
+    column_sizes = [10**5] if quick else [10**5, 10**6]
+    for size in column_sizes:
+        subject_ids = make_subject_ids(size)
+        columns = {"list": subject_ids, "numpy": np.array(subject_ids)}
+        if pd is not None:
+            columns["pandas"] = pd.Series(subject_ids)
+        column_functions = (("keep_only_digits", lambda s: utils_strings.keep_only_digits(s), lambda col: utils_strings.keep_only_digits_column(col)),
+                            ("add_leading_zeros", lambda s: utils_strings.add_leading_zeros(s, 20), lambda col: utils_strings.add_leading_zeros_column(col, 20)),
+                            ("remove_leading_zeros", lambda s: utils_strings.remove_leading_zeros(s), lambda col: utils_strings.remove_leading_zeros_column(col)))
+        for fn_name, scalar_fn, column_fn in column_functions:
+            scalar_name = "utils_strings.{}[size={}]".format(fn_name, size)
+            yield scalar_name, lambda ids=subject_ids, fn=scalar_fn: [fn(subject_id) for subject_id in ids], None
+            if pd is not None:  # the scalar function applied element by element to the Series, as done on csv columns
+                series_scalar_name = "utils_strings.{}[size={},type=pandas]".format(fn_name, size)
+                yield series_scalar_name, lambda col=columns["pandas"], fn=scalar_fn: col.map(fn), None
+            for column_type, column in columns.items():
+                yield ("utils_strings.{}_column[size={},type={}]".format(fn_name, size, column_type),
+                       lambda col=column, fn=column_fn: fn(col), series_scalar_name if column_type == "pandas" else scalar_name)
+
+
+def run_benchmarks(quick: bool = False, repeats: int = 5, only: str = None) -> Dict[str, Dict[str, float]]:
+    """This function runs all the benchmark cases and collects their timings and peak memory
+    Args:
+        quick (bool): if True, only small inputs are used; defaults to False
+        repeats (int): number of timed runs per case; defaults to 5
+        only (str): if not None, only run the cases whose name contains this substring
+    Returns:
+        results (dict): for each case, the timing aggregates of SpanProfiler.summary plus "peak_memory_bytes" and
+            "reference_case" (see iter_benchmark_cases)
+    """
+    time_profiler = SpanProfiler()
+    memory_profiler = SpanProfiler(trace_memory=True)  # separate runs, since tracemalloc slows the code down
+    reference_cases = {}  # type: Dict[str, Optional[str]]
+    tmp_dir = tempfile.mkdtemp(prefix="python_utils_benchmarks_")
+    try:
+        for case_name, fn, reference_name in iter_benchmark_cases(tmp_dir, quick):
+            if only is not None and only not in case_name:
+                continue
+            reference_cases[case_name] = reference_name
+            fn()  # warm-up (imports, caches, page cache)
+            for _ in range(repeats):
+                with time_profiler.span(case_name):
+                    fn()
+            with memory_profiler.span(case_name):
+                fn()
+            stats = time_profiler.summary()[case_name]
+            print("{:<110} p50 {:>10.4f} s   max {:>10.4f} s".format(case_name, stats["p50_s"], stats["max_s"]))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    peak_memory = memory_profiler.summary()
+    results = {}
+    for case_name, stats in time_profiler.summary().items():
+        results[case_name] = dict(stats, peak_memory_bytes=peak_memory[case_name]["max_peak_memory_bytes"],
+                                  reference_case=reference_cases[case_name])
+
+    return results
+
+
+def compare_with_references(results: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+    """This function compares the median time of each case with the one of its reference case (the implementation
+    it replaces), when both were run
+    Args:
+        results (dict): results of run_benchmarks
+    Returns:
+        speedups (dict): for each case with a reference, reference p50 / case p50 (>1 means the case is faster)
+    """
+    speedups = {}
+    print("\n{:<110} {:>12} {:>12} {:>8}".format("case", "reference (s)", "current (s)", "speedup"))
+    for case_name, stats in results.items():
+        reference_name = stats.get("reference_case")
+        if reference_name is None or reference_name not in results:
+            continue
+        reference_p50, current_p50 = results[reference_name]["p50_s"], stats["p50_s"]
+        speedups[case_name] = reference_p50 / current_p50 if current_p50 > 0 else float("inf")
+        print("{:<110} {:>12.4f} {:>12.4f} {:>8.2f}".format(case_name, reference_p50, current_p50, speedups[case_name]))
+
+    return speedups
+
+
+def compare_with_baseline(results: Dict[str, Dict[str, float]],
+                          baseline: Dict[str, Dict[str, float]],
+                          threshold: float) -> List[Tuple[str, float, float]]:
+    """This function compares the median times of the current run with the ones of a baseline run
+    Args:
+        results (dict): results of the current run
+        baseline (dict): results of the baseline run
+        threshold (float): relative slowdown above which a case is flagged (e.g. 0.2 flags cases that are >20% slower)
+    Returns:
+        regressions (list): (case_name, baseline_p50_s, current_p50_s) for each flagged case
+    """
+    regressions = []
+    print("\n{:<110} {:>12} {:>12} {:>8}".format("case", "baseline (s)", "current (s)", "ratio"))
+    for case_name, stats in results.items():
+        if case_name not in baseline:
+            continue
+        baseline_p50, current_p50 = baseline[case_name]["p50_s"], stats["p50_s"]
+        ratio = current_p50 / baseline_p50 if baseline_p50 > 0 else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append((case_name, baseline_p50, current_p50))
+            flag = "  <-- REGRESSION"
+        print("{:<110} {:>12.4f} {:>12.4f} {:>8.2f}{}".format(case_name, baseline_p50, current_p50, ratio, flag))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths of the utility modules")
+    parser.add_argument("--out", default="benchmark_results.json", help="path of the output json file")
+    parser.add_argument("--baseline", default=None, help="json file of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown flagged as regression (default: 0.2)")
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs per case (default: 5)")
+    parser.add_argument("--quick", action="store_true", help="only use small inputs")
+    parser.add_argument("--only", default=None, help="only run the cases whose name contains this substring")
+    args = parser.parse_args()
+
+    results = run_benchmarks(quick=args.quick, repeats=args.repeats, only=args.only)
+    compare_with_references(results)
+    metadata = {"date": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "simpleitk": sitk.Version_VersionString(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "quick": args.quick,
+                "repeats": args.repeats}
+    with open(args.out, "w") as out_file:
+        json.dump({"metadata": metadata, "results": results}, out_file, indent=2)
+    print("\nResults saved to {}".format(args.out))
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+        if regressions:
+            print("\n{} case(s) are more than {:.0%} slower than the baseline".format(len(regressions), args.threshold))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
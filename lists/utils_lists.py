@@ -1,8 +1,26 @@
 import os
+import re
+import math
+import heapq
+import random
 import pickle
-from collections import Counter
+import gzip
+import itertools
+import json
+import shutil
+import tempfile
+import functools
+from collections import Counter, deque, defaultdict
+from operator import itemgetter
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 import glob
-from typing import Iterator, Dict, List, Any
+import numpy as np
+from typing import Iterator, Iterable, Callable, Dict, List, Tuple, Any, Optional, Union
+
+# name of the file that describes a list saved with the "chunked" backend of save_list_to_disk
+CHUNKED_LIST_INDEX_FILENAME = "index.json"
+# operations supported by multi_list_set_operation
+SET_OPERATIONS = ("intersection", "difference", "unique", "duplicates")
 
 
 def save_list_to_disk_with_pickle(list_to_save: list, out_dir: str, out_filename: str) -> None:
@@ -38,6 +56,176 @@ def load_list_from_disk_with_pickle(path_to_list: str) -> list:
     return loaded_list
 
 
+def _as_numeric_array(input_list: Union[list, np.ndarray]) -> Union[np.ndarray, None]:
+    """This function converts the input list to a numeric numpy array, if the list is homogeneous and numeric
+    Args:
+        input_list (list): input list (or array)
+    Returns:
+        numeric_array (np.ndarray): input list as numeric array; None if the list can't be stored as a numeric array
+            without losing information (e.g. mixed types, ragged sublists, strings, ...)
+    """
+    if isinstance(input_list, np.ndarray):
+        return input_list if input_list.dtype.kind in "biufc" else None
+    if len(set(map(type, input_list))) != 1:  # mixed types (e.g. int and float) would be silently converted
+        return None
+    try:
+        numeric_array = np.asarray(input_list)
+    except ValueError:  # e.g. ragged sublists
+        return None
+
+    return numeric_array if numeric_array.dtype.kind in "biufc" else None
+
+
+def _create_tmp_path(out_dir: str, prefix: str, is_dir: bool) -> Tuple[str, Optional[int]]:
+    """This function creates a new, uniquely named temporary file or directory inside out_dir. Unlike tempfile, which
+    creates private paths (0600 files, 0700 directories), it uses the default modes of open and os.mkdir (0666 and 0777
+    minus the umask), so the final path gets the same permissions as if it had been written directly
+    Args:
+        out_dir (str): directory where the temporary path is created
+        prefix (str): prefix of the temporary name
+        is_dir (bool): if True, a directory is created; otherwise a file
+    Returns:
+        tmp_path (str): path of the created file or directory
+        file_descriptor (int): descriptor of the created file, open for writing; None for directories
+    """
+    while True:
+        tmp_path = os.path.join(out_dir, "{}{}".format(prefix, os.urandom(8).hex()))
+        try:
+            if is_dir:
+                os.mkdir(tmp_path, 0o777)
+                return tmp_path, None
+            return tmp_path, os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, "O_BINARY", 0), 0o666)
+        except FileExistsError:  # name already taken: try another one
+            continue
+
+
+def _replace_path_atomically(tmp_path: str, out_path: str) -> None:
+    """This function moves tmp_path (file or directory) to out_path, replacing any existing file or directory, so
+    that readers never see a partially written out_path. Replacing a file with a file is atomic (a single os.replace);
+    when a directory is involved, the old path is first moved away and then tmp_path is renamed, so for a brief moment
+    out_path does not exist
+    Args:
+        tmp_path (str): path of the fully written temporary file or directory
+        out_path (str): final path
+    Returns:
+        None
+    """
+    if os.path.exists(out_path) and (os.path.isdir(out_path) or os.path.isdir(tmp_path)):
+        # os.replace can't overwrite a directory (or a file with a directory), so we first move the old path away
+        old_path = tempfile.mkdtemp(dir=os.path.dirname(out_path) or ".")
+        os.replace(out_path, os.path.join(old_path, "old"))
+        os.replace(tmp_path, out_path)
+        shutil.rmtree(old_path)
+    else:
+        os.replace(tmp_path, out_path)
+
+
+def save_list_to_disk(list_to_save: Union[list, np.ndarray],
+                      out_dir: str,
+                      out_filename: str,
+                      backend: str = "auto",
+                      compress: bool = False,
+                      chunk_size: int = 10000) -> str:
+    """This function saves a list to disk with one of the following backends:
+        "npy": for homogeneous numeric lists (or arrays); the list is saved as a .npy array, which can be memory-mapped when loading
+        "chunked": for generic lists; the list is split in chunks of chunk_size items, each pickled in its own file
+            (optionally gzip-compressed), so that a range of items can be loaded without reading the whole list
+        "pickle": the whole list is pickled in one file (like save_list_to_disk_with_pickle)
+        "auto": "npy" if the list is homogeneous and numeric, "chunked" otherwise
+    The list is written to a temporary path that is then renamed to the final path, so readers never see a partially
+    written list (the rename is atomic for the single-file backends; for "chunked" lists it's a two-step rename).
+    Args:
+        list_to_save (list): list that we want to save
+        out_dir (str): path to output folder; will be created if not present
+        out_filename (str): output filename (for the "chunked" backend, it's the name of a directory)
+        backend (str): one of "auto", "npy", "chunked", "pickle"; defaults to "auto"
+        compress (bool): whether to gzip-compress the chunks; only used by the "chunked" backend. Defaults to False
+        chunk_size (int): number of items per chunk; only used by the "chunked" backend. Defaults to 10000
+    Returns:
+        out_path (str): path where the list was saved; it can be loaded with load_list_from_disk
+    Raises:
+        ValueError: if backend is unknown, or if backend is "npy" and the list is not homogeneous and numeric
+    """
+    if backend not in ("auto", "npy", "chunked", "pickle"):
+        raise ValueError("backend can only be 'auto', 'npy', 'chunked' or 'pickle'. Got {} instead".format(backend))
+    if not os.path.exists(out_dir):  # if output folder does not exist
+        os.makedirs(out_dir)  # create it
+    out_path = os.path.join(out_dir, out_filename)
+
+    numeric_array = _as_numeric_array(list_to_save) if backend in ("auto", "npy") else None
+    if backend == "npy" and numeric_array is None:
+        raise ValueError("The 'npy' backend only supports homogeneous numeric lists")
+    if backend == "auto":
+        backend = "npy" if numeric_array is not None else "chunked"
+
+    if backend == "chunked":
+        tmp_path, _ = _create_tmp_path(out_dir, ".tmp_" + out_filename, is_dir=True)
+        nb_chunks = 0
+        for nb_chunks, start_idx in enumerate(range(0, len(list_to_save), chunk_size), start=1):
+            chunk_path = os.path.join(tmp_path, "chunk_{:06d}.pkl".format(nb_chunks - 1))
+            with (gzip.open(chunk_path, "wb", compresslevel=6) if compress else open(chunk_path, "wb")) as chunk_file:
+                pickle.dump(list(list_to_save[start_idx:start_idx + chunk_size]), chunk_file, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(tmp_path, CHUNKED_LIST_INDEX_FILENAME), "w") as index_file:
+            json.dump({"format": "chunked_list", "version": 1, "nb_items": len(list_to_save), "chunk_size": chunk_size,
+                       "nb_chunks": nb_chunks, "compress": compress}, index_file)
+    else:
+        tmp_path, file_descriptor = _create_tmp_path(out_dir, ".tmp_" + out_filename, is_dir=False)
+        with os.fdopen(file_descriptor, "wb") as out_file:
+            if backend == "npy":
+                np.save(out_file, numeric_array, allow_pickle=False)
+            else:
+                pickle.dump(list_to_save, out_file)
+    _replace_path_atomically(tmp_path, out_path)
+
+    return out_path
+
+
+def load_list_from_disk(path_to_list: str,
+                        start: int = None,
+                        stop: int = None,
+                        mmap: bool = True) -> Union[list, np.ndarray]:
+    """This function loads a list saved with save_list_to_disk (any backend) or with save_list_to_disk_with_pickle.
+    Only the items in the range [start, stop) are loaded: "npy" lists are memory-mapped and "chunked" lists only read
+    the chunks that overlap the range; pickle files are always read entirely
+    Args:
+        path_to_list (str): path to where the list is saved
+        start (int): index of the first item to load; defaults to the beginning of the list
+        stop (int): index after the last item to load; defaults to the end of the list
+        mmap (bool): whether to memory-map "npy" lists (i.e. values are only read from disk when accessed); defaults to True
+    Returns:
+        loaded_list (list): loaded list; "npy" lists are returned as numpy arrays
+    Raises:
+        AssertionError: if list path does not exist
+    Example:
+        >>> out_path = save_list_to_disk(y_pred, out_dir, "y_pred_fold_1")
+        >>> first_predictions = load_list_from_disk(out_path, start=0, stop=1000)
+    """
+    assert os.path.exists(path_to_list), "Path {} does not exist".format(path_to_list)
+    items_range = slice(start, stop)
+
+    if os.path.isdir(path_to_list):  # "chunked" backend
+        with open(os.path.join(path_to_list, CHUNKED_LIST_INDEX_FILENAME)) as index_file:
+            index = json.load(index_file)
+        start_idx, stop_idx, _ = items_range.indices(index["nb_items"])
+        loaded_list = []
+        for chunk_idx in range(start_idx // index["chunk_size"], -(-stop_idx // index["chunk_size"])):  # only chunks that overlap the range
+            chunk_path = os.path.join(path_to_list, "chunk_{:06d}.pkl".format(chunk_idx))
+            with (gzip.open(chunk_path, "rb") if index["compress"] else open(chunk_path, "rb")) as chunk_file:
+                chunk = pickle.load(chunk_file)
+            chunk_start_idx = chunk_idx * index["chunk_size"]
+            loaded_list.extend(chunk[max(0, start_idx - chunk_start_idx):stop_idx - chunk_start_idx])
+        return loaded_list
+
+    with open(path_to_list, "rb") as in_file:
+        is_npy = in_file.read(6) == b"\x93NUMPY"  # magic string of the .npy format
+    if is_npy:
+        loaded_list = np.load(path_to_list, mmap_mode="r" if mmap else None, allow_pickle=False)[items_range]
+    else:  # old pickle files
+        loaded_list = load_list_from_disk_with_pickle(path_to_list)[items_range]
+
+    return loaded_list
+
+
 def load_list_from_partial_name_with_glob(input_dir: str, partial_filename: str) -> list:
     """This function loads a list from disk by knowing only part of the filename
     Args:
@@ -56,6 +244,53 @@ def load_list_from_partial_name_with_glob(input_dir: str, partial_filename: str)
     return list_of_interest
 
 
+def _natural_sort_key(input_string: str) -> list:
+    """This function returns a key to sort strings in natural order (e.g. "fold_2" comes before "fold_10")
+    Args:
+        input_string (str): string to sort
+    Returns:
+        key (list): sort key, where digit sequences are compared as integers
+    """
+    key = [int(token) if token.isdigit() else token.lower() for token in re.split(r"(\d+)", input_string)]
+
+    return key
+
+
+def load_lists_from_partial_name_with_glob(input_dir: str,
+                                           partial_filename: str,
+                                           natural_sort: bool = True,
+                                           workers: int = 8,
+                                           concatenate: bool = False) -> Union[Dict[str, Any], Iterator[Any]]:
+    """This function loads all the lists whose filename matches partial_filename. The files are loaded concurrently
+    in a thread pool, and they can be saved with any backend supported by load_list_from_disk
+    Args:
+        input_dir (str): directory where lists were saved
+        partial_filename (str): partial filename (use * as wildcard)
+        natural_sort (bool): if True (default), filenames are sorted in natural order (e.g. fold_2 before fold_10);
+            otherwise, they are sorted alphabetically
+        workers (int): number of threads used to load the files; defaults to 8
+        concatenate (bool): if True, the loaded lists are returned as one lazily concatenated iterator of items
+            (in filename order) instead of a dict; defaults to False
+    Returns:
+        lists_by_filename (dict): it maps each matching filename (relative to input_dir) to its loaded list, in sorted
+            order; if concatenate is True, an iterator over the items of all lists is returned instead
+    Example:
+        # suppose the filenames are y_true_fold_1, y_true_fold_2, ..., y_true_fold_10, we can call:
+        >>> y_true_by_fold = load_lists_from_partial_name_with_glob(path_to_dir, 'y_true_fold_*')
+        >>> all_y_true = list(load_lists_from_partial_name_with_glob(path_to_dir, 'y_true_fold_*', concatenate=True))
+    """
+    file_paths = glob.glob(os.path.join(input_dir, partial_filename))  # type: list
+    file_paths.sort(key=_natural_sort_key if natural_sort else None)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        loaded_lists = list(executor.map(load_list_from_disk, file_paths))
+    lists_by_filename = {os.path.relpath(file_path, input_dir): loaded_list for file_path, loaded_list in zip(file_paths, loaded_lists)}
+
+    if concatenate:
+        return itertools.chain.from_iterable(lists_by_filename.values())
+
+    return lists_by_filename
+
+
 def find_common_elements(list1: list, list2: list) -> list:
     """This function takes as input two lists and returns a list with the common elements
     Args:
@@ -84,6 +319,114 @@ def most_frequent_n_elements(input_list: list, n: int) -> Any:
     return most_frequent_n_items
 
 
+def _iter_chunks(input_iterable: Iterable, chunk_size: int) -> Iterator[list]:
+    """This function splits any iterable (e.g. a generator) into lists of chunk_size items, without materializing it
+    Args:
+        input_iterable (Iterable): input iterable
+        chunk_size (int): number of items per chunk (the last chunk can be shorter)
+    Returns:
+        chunks (Iterator[list]): consecutive chunks of the input iterable
+    """
+    iterator = iter(input_iterable)
+    chunk = list(itertools.islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(iterator, chunk_size))
+
+
+def _map_with_bounded_queue(executor: Executor, fn: Callable, items: Iterable, max_in_flight: int) -> Iterator[Any]:
+    """This function is like executor.map, but it submits at most max_in_flight items at a time, so that long
+    (or unbounded) iterables are not consumed all at once
+    Args:
+        executor (Executor): thread or process pool executor used to run fn
+        fn (Callable): function to apply to each item
+        items (Iterable): items to process; can be a generator
+        max_in_flight (int): maximum number of submitted but not yet consumed items
+    Returns:
+        results (Iterator[Any]): outputs of fn, in input order
+    """
+    items = iter(items)
+    pending = deque(executor.submit(fn, item) for item in itertools.islice(items, max_in_flight))
+    while pending:
+        result = pending.popleft().result()
+        for item in itertools.islice(items, 1):
+            pending.append(executor.submit(fn, item))
+        yield result
+
+
+def _prune_counter(counter: Counter, max_counters: int) -> Counter:
+    """This function reduces a counter to at most max_counters items with the Misra-Gries rule: the (max_counters + 1)-th
+    largest count is subtracted from all counts and the items whose count drops to zero are dropped. Each estimated
+    count then underestimates the true count by at most N / (max_counters + 1), where N is the number of counted items
+    Args:
+        counter (Counter): counter to prune
+        max_counters (int): maximum number of items that we want to keep
+    Returns:
+        pruned_counter (Counter): pruned counter
+    """
+    if len(counter) <= max_counters:
+        return counter
+    threshold = heapq.nlargest(max_counters + 1, counter.values())[-1]
+    pruned_counter = Counter({item: count - threshold for item, count in counter.items() if count > threshold})
+
+    return pruned_counter
+
+
+def most_frequent_n_elements_streaming(input_iterable: Iterable,
+                                       n: int,
+                                       chunk_size: int = 100000,
+                                       approximate: bool = False,
+                                       epsilon: float = 1e-4,
+                                       max_counters: int = None,
+                                       workers: int = 1) -> List[Tuple[Any, int]]:
+    """This function returns the n most frequent items of any iterable (e.g. a generator of log records that doesn't fit
+    in RAM). The items are counted one chunk at a time, and the per-chunk counters are merged as they arrive.
+        exact mode (default): the result is identical to most_frequent_n_elements; the memory grows with the number of distinct items
+        approximate mode: the merged counter is pruned after each chunk with the Misra-Gries rule (the deterministic
+            counterpart of Space-Saving), so at most max_counters items are kept; each returned count underestimates the
+            true count by at most epsilon * N (N = total number of items), and every item that occurs more than
+            epsilon * N times is guaranteed to be tracked
+    Args:
+        input_iterable (Iterable): items to count; they must be hashable (and picklable if workers > 1)
+        n (int): number of most frequent items to return
+        chunk_size (int): number of items counted at once; defaults to 100000
+        approximate (bool): whether to use the approximate mode; defaults to False
+        epsilon (float): error bound of the approximate mode, as a fraction of the number of items; it sets the number
+            of counters to ceil(1 / epsilon). Defaults to 1e-4
+        max_counters (int): optional cap on the number of counters of the approximate mode (i.e. on its memory); if it's
+            lower than ceil(1 / epsilon), the error bound becomes N / (max_counters + 1)
+        workers (int): number of processes that count the chunks in parallel; defaults to 1 (no parallelism)
+    Returns:
+        most_frequent_n_items (List[Tuple[Any, int]]): list of (item, count) tuples, sorted by decreasing count
+    Example:
+        >>> records = (line.split()[0] for line in open("/path/to/huge.log"))
+        >>> most_frequent_n_elements_streaming(records, 10, approximate=True, epsilon=1e-5)
+    """
+    nb_counters = None
+    if approximate:
+        nb_counters = math.ceil(1 / epsilon)
+        if max_counters is not None:
+            nb_counters = min(nb_counters, max_counters)
+        nb_counters = max(nb_counters, n)
+
+    chunks = _iter_chunks(input_iterable, chunk_size)
+    occurrence_count = Counter()  # type: Counter
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for chunk_count in _map_with_bounded_queue(executor, Counter, chunks, max_in_flight=2 * workers):
+                occurrence_count.update(chunk_count)
+                if nb_counters is not None:
+                    occurrence_count = _prune_counter(occurrence_count, nb_counters)
+    else:
+        for chunk in chunks:
+            occurrence_count.update(chunk)
+            if nb_counters is not None:
+                occurrence_count = _prune_counter(occurrence_count, nb_counters)
+    most_frequent_n_items = occurrence_count.most_common(n)
+
+    return most_frequent_n_items
+
+
 def flatten_list(list_of_lists: list) -> list:
     """This function flattens the input list
     Args:
@@ -96,6 +439,59 @@ def flatten_list(list_of_lists: list) -> list:
     return flattened_list
 
 
+def iter_flatten(nested_list: Iterable, depth: int = None, nested_types: tuple = (list, tuple)) -> Iterator[Any]:
+    """This function lazily flattens the input nested list, i.e. it yields the items one by one without building the
+    flattened list (O(1) extra memory besides one iterator per nesting level). Sublists at the last level to flatten are
+    yielded as a block, so their items are not type-checked one by one
+    Args:
+        nested_list (Iterable): input nested list (or any nested iterable) that we want to flatten
+        depth (int): number of nesting levels to flatten (e.g. depth=1 is equivalent to flatten_list); if None (default),
+            the list is flattened completely
+        nested_types (tuple): types that are considered sublists (and therefore flattened); defaults to (list, tuple)
+    Returns:
+        items (Iterator[Any]): items of the flattened list
+    Example:
+        >>> list(iter_flatten([1, [2, [3, [4]]]], depth=2))
+        [1, 2, 3, [4]]
+    """
+    if depth is not None and depth <= 0:
+        yield from nested_list
+        return
+
+    stack = [iter(nested_list)]  # one iterator per nesting level that we are currently visiting
+    while stack:
+        for item in stack[-1]:
+            if isinstance(item, nested_types):
+                if depth is not None and len(stack) == depth:  # last level to flatten: no need to inspect the items
+                    yield from item
+                else:  # go one level deeper; the current iterator resumes from here when the sublist is exhausted
+                    stack.append(iter(item))
+                    break
+            else:
+                yield item
+        else:  # current level exhausted
+            stack.pop()
+
+
+def iter_duplicates(input_iterable: Iterable) -> Iterator[Any]:
+    """This function lazily yields the items of the input iterable that were already seen, as soon as they are
+    encountered; to know whether there is any duplicate, we can stop at the first one (e.g. with next or any)
+    Args:
+        input_iterable (Iterable): input iterable (e.g. a list or iter_flatten(nested_list)); items must be hashable
+    Returns:
+        duplicates (Iterator[Any]): each repeated occurrence of an item
+    Example:
+        >>> next(iter_duplicates(["id_1", "id_2", "id_1", "id_3"]))
+        'id_1'
+    """
+    seen_items = set()  # type: set
+    for item in input_iterable:
+        if item in seen_items:
+            yield item
+        else:
+            seen_items.add(item)
+
+
 def find_difference_list(list1: list, list2: list) -> list:
     """This function takes as input two lists and returns the difference list between them
     Args:
@@ -139,6 +535,23 @@ def find_indexes_where_lists_differ(list1: list, list2: list) -> list:
     return out_list
 
 
+def find_indexes_where_arrays_differ(array1: Union[list, np.ndarray], array2: Union[list, np.ndarray]) -> np.ndarray:
+    """This function is the numpy version of find_indexes_where_lists_differ, for numeric lists or arrays
+    Args:
+        array1 (np.ndarray): first input array (or list)
+        array2 (np.ndarray): second input array (or list)
+    Returns:
+        idxs (np.ndarray): indexes where the two inputs differ
+    Raises:
+        AssertionError: if the two inputs do not have the same length
+    """
+    array1, array2 = np.asarray(array1), np.asarray(array2)
+    assert len(array1) == len(array2), "The two input arrays must have same length"
+    idxs = np.flatnonzero(array1 != array2)
+
+    return idxs
+
+
 def extract_unique_elements(lst: list, ordered=True) -> list:
     """This function extracts the unique elements of the input list (i.e. it removes duplicates)
     and returns them as an output list; if ordered=True (as by defualt), the returned list is ordered.
@@ -155,14 +568,54 @@ def extract_unique_elements(lst: list, ordered=True) -> list:
     
     return out_list
 
-def find_idxs_of_element_in_list(lst: list, element: Any) -> list:
+def build_inverted_index(lst: Union[list, np.ndarray]) -> Dict[Any, List[int]]:
+    """This function builds, in a single pass, an inverted index of the input list, i.e. a dict that maps each distinct
+    element to the (sorted) list of its positions; lists of numbers of the same type are indexed with a stable numpy
+    argsort instead of a python loop
+    Args:
+        lst (list): input list (or 1D array) that we want to index; items must be hashable
+    Returns:
+        inverted_index (Dict[Any, List[int]]): it maps each element to the list of its indexes
+    Example:
+        >>> inverted_index = build_inverted_index(["b", "a", "b"])
+        >>> inverted_index["b"]
+        [0, 2]
+    """
+    scalar_array = _as_scalar_array(lst) if len(lst) > 0 else None
+    if scalar_array is not None and (scalar_array.dtype.kind in "US" or (scalar_array.dtype.kind == "f" and np.isnan(scalar_array).any())):
+        scalar_array = None  # numpy strips trailing NULs from strings and never groups nans: the python loop keeps dict semantics
+    if scalar_array is None:
+        inverted_index = defaultdict(list)  # type: defaultdict
+        for idx, item in enumerate(lst):
+            inverted_index[item].append(idx)
+        return dict(inverted_index)
+
+    order = np.argsort(scalar_array, kind="stable")  # stable: the indexes of each element stay sorted
+    sorted_values = scalar_array[order]
+    group_starts = np.concatenate(([0], np.flatnonzero(sorted_values[1:] != sorted_values[:-1]) + 1))
+    group_bounds = group_starts.tolist() + [len(order)]
+    order = order.tolist()
+    inverted_index = {element: order[start:stop] for element, start, stop in zip(sorted_values[group_starts].tolist(), group_bounds, group_bounds[1:])}
+
+    return inverted_index
+
+
+def find_idxs_of_element_in_list(lst: list, element: Any, inverted_index: Dict[Any, List[int]] = None) -> list:
     """This function returns the indexes of the input list that have value == element
     Args:
         lst (list): input list where we search for indexes
         element (Any): element of which we want to find the indexes
+        inverted_index (Dict[Any, List[int]]): optional output of build_inverted_index(lst); if given, the indexes are
+            looked up in O(1) instead of scanning lst, which pays off when we search many elements in the same list
     Returns:
         idxs (list): list of indexes corresponding to element
+    Example:
+        >>> inverted_index = build_inverted_index(subject_ids)
+        >>> idxs_per_query = [find_idxs_of_element_in_list(subject_ids, query, inverted_index) for query in queries]
     """
+    if inverted_index is not None:
+        idxs = list(inverted_index.get(element, []))  # copy, so that the caller can't modify the index
+        return idxs
     idxs = [i for i, x in enumerate(lst) if x == element]
     
     return idxs
@@ -187,9 +640,8 @@ def list_has_duplicates(input_list: list) -> bool:
     Returns:
         has_duplicates (bool): True if list has duplicates, False if it doesn’t
     """
-    if list_is_nested(input_list):
-        input_list = flatten_list(input_list)  # flatten list
-    has_duplicates = len(input_list) != len(set(input_list))
+    items = iter_flatten(input_list, depth=1, nested_types=(list,))  # lazily flatten the sublists, if any
+    has_duplicates = any(True for _ in iter_duplicates(items))  # stop at the first duplicate
     
     return has_duplicates
 
@@ -207,6 +659,19 @@ def first_argmax(input_list) -> int:
     return idx_max
 
 
+def first_argmax_array(input_array: Union[list, np.ndarray]) -> int:
+    """This function is the numpy version of first_argmax, for numeric lists or arrays; if there are duplicate max values,
+    the index of the first one is returned
+    Args:
+        input_array (np.ndarray): array (or list) for which we want to find the argmax
+    Returns:
+        idx_max (int): index corresponding to the maximum value
+    """
+    idx_max = int(np.argmax(np.asarray(input_array)))
+
+    return idx_max
+
+
 def shuffle_two_lists_with_same_order(x: list, y: list, chosen_seed: int = 123):
     """This function shuffles the two input lists with the same order
     Args:
@@ -226,6 +691,120 @@ def shuffle_two_lists_with_same_order(x: list, y: list, chosen_seed: int = 123):
     shuffled_x, shuffled_y = zip(*zipped_x_and_y)  # unzip into x and y
     
     return shuffled_x, shuffled_y
+
+
+def aligned_permutation(*sequences: Union[list, np.ndarray], seed: Union[int, np.random.Generator] = 123) -> np.ndarray:
+    """This function draws one random permutation of the indexes of any number of aligned sequences (lists or arrays with
+    the same length). It uses its own numpy Generator, so it never touches the global random state and it's safe to
+    use inside parallel workers. The sequences are not copied: apply the permutation with apply_permutation (or seq[idxs])
+    Args:
+        *sequences (list or np.ndarray): aligned sequences that we want to shuffle with the same order
+        seed (int or np.random.Generator): seed (or generator) to use for reproducibility; defaults to 123
+    Returns:
+        idxs (np.ndarray): permutation of range(len(sequences[0]))
+    Raises:
+        AssertionError: if no sequence is given or if the sequences do not have the same length
+    Example:
+        >>> idxs = aligned_permutation(x, y, seed=42)
+        >>> shuffled_x, shuffled_y = apply_permutation(x, idxs), apply_permutation(y, idxs)
+    """
+    assert len(sequences) > 0, "At least one sequence is needed"
+    assert len({len(sequence) for sequence in sequences}) == 1, "All input sequences must have the same length"
+    idxs = np.random.default_rng(seed).permutation(len(sequences[0]))
+
+    return idxs
+
+
+def apply_permutation(sequence: Union[list, np.ndarray], idxs: np.ndarray) -> Union[list, np.ndarray]:
+    """This function reorders the input sequence according to idxs (e.g. the output of aligned_permutation)
+    Args:
+        sequence (list or np.ndarray): sequence to reorder
+        idxs (np.ndarray): new order of the items
+    Returns:
+        reordered_sequence (list or np.ndarray): reordered sequence, of the same type as the input sequence
+    """
+    if isinstance(sequence, np.ndarray):
+        return np.take(sequence, idxs, axis=0)
+    reordered_sequence = slice_by_index(sequence, idxs.tolist() if isinstance(idxs, np.ndarray) else list(idxs))
+
+    return reordered_sequence
+
+
+def split_indices_equal_sized_groups(nb_items: int, n: int, seed: Union[int, np.random.Generator] = 123) -> List[np.ndarray]:
+    """This function is like split_list_equal_sized_groups, but it splits the indexes instead of the list itself, so the
+    input list is neither copied nor shuffled in place
+    Args:
+        nb_items (int): length of the list that we want to split
+        n (int): number of splits
+        seed (int or np.random.Generator): seed (or generator) to use; defaults to 123
+    Returns:
+        idxs_per_group (List[np.ndarray]): list of index arrays, one per split; their sizes differ by at most one
+    """
+    idxs_per_group = np.array_split(np.random.default_rng(seed).permutation(nb_items), n)
+
+    return idxs_per_group
+
+
+def kfold_indices(nb_samples: int,
+                  n_splits: int,
+                  seed: Union[int, np.random.Generator] = 123,
+                  shuffle: bool = True,
+                  stratify: Union[list, np.ndarray] = None,
+                  groups: Union[list, np.ndarray] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """This function computes the train/test indexes of a k-fold split, without copying or reordering the data
+        - plain: samples are dealt into n_splits folds of (almost) equal size
+        - stratified (stratify is given): each fold gets (almost) the same number of samples of each class
+        - group-aware (groups is given): all the samples of a group (e.g. the scans of one subject) end up in the same
+          fold; groups are assigned to folds from the largest to the smallest, always to the currently smallest fold
+    The random state is a local numpy Generator, so the global random state is never touched
+    Args:
+        nb_samples (int): number of samples
+        n_splits (int): number of folds
+        seed (int or np.random.Generator): seed (or generator) to use; defaults to 123
+        shuffle (bool): whether to shuffle the samples (or groups) before splitting; defaults to True
+        stratify (list or np.ndarray): optional class label of each sample
+        groups (list or np.ndarray): optional group label of each sample
+    Returns:
+        folds (List[Tuple[np.ndarray, np.ndarray]]): one (train_idxs, test_idxs) tuple per fold
+    Raises:
+        ValueError: if both stratify and groups are given, or if their length differs from nb_samples
+    Example:
+        >>> for train_idxs, test_idxs in kfold_indices(len(subjects), 5, stratify=labels):
+        ...     train_subjects = apply_permutation(subjects, train_idxs)
+    """
+    if stratify is not None and groups is not None:
+        raise ValueError("stratify and groups can't be used together")
+    rng = np.random.default_rng(seed)
+    random_keys = rng.permutation(nb_samples) if shuffle else np.arange(nb_samples)
+
+    if groups is not None:
+        if len(groups) != nb_samples:
+            raise ValueError("groups must have length {}; got {}".format(nb_samples, len(groups)))
+        _, group_of_sample = np.unique(np.asarray(groups), return_inverse=True)
+        group_sizes = np.bincount(group_of_sample)
+        group_order = rng.permutation(group_sizes.size) if shuffle else np.arange(group_sizes.size)
+        group_order = group_order[np.argsort(-group_sizes[group_order], kind="stable")]  # largest groups first
+        fold_of_group = np.empty(group_sizes.size, dtype=np.intp)
+        fold_heap = [(0, fold_idx) for fold_idx in range(n_splits)]  # (current fold size, fold index)
+        for group_idx in group_order.tolist():
+            fold_size, fold_idx = heapq.heappop(fold_heap)
+            fold_of_group[group_idx] = fold_idx
+            heapq.heappush(fold_heap, (fold_size + int(group_sizes[group_idx]), fold_idx))
+        fold_of_sample = fold_of_group[group_of_sample]
+    else:
+        if stratify is not None:
+            if len(stratify) != nb_samples:
+                raise ValueError("stratify must have length {}; got {}".format(nb_samples, len(stratify)))
+            _, class_of_sample = np.unique(np.asarray(stratify), return_inverse=True)
+            order = np.lexsort((random_keys, class_of_sample))  # samples grouped by class, in random order within each class
+        else:
+            order = np.argsort(random_keys)
+        fold_of_sample = np.empty(nb_samples, dtype=np.intp)
+        fold_of_sample[order] = np.arange(nb_samples) % n_splits  # deal the samples into the folds like cards
+
+    folds = [(np.flatnonzero(fold_of_sample != fold_idx), np.flatnonzero(fold_of_sample == fold_idx)) for fold_idx in range(n_splits)]
+
+    return folds
     
 
 def slice_by_index(lst, indexes):
@@ -257,6 +836,22 @@ def slice_by_index(lst, indexes):
     return list(slice_)
 
 
+def slice_array_by_index(input_array: Union[list, np.ndarray], indexes: Union[list, np.ndarray]) -> np.ndarray:
+    """This function is the numpy version of slice_by_index, for numeric lists or arrays
+    Args:
+        input_array (np.ndarray): array (or list) to slice
+        indexes (np.ndarray): 0-based indexes of the positions to return
+    Returns:
+        sliced_array (np.ndarray): elements of input_array on the positions specified by indexes
+    Examples:
+        >>> slice_array_by_index([10, 20, 30], [0, 2])
+        array([10, 30])
+    """
+    sliced_array = np.take(np.asarray(input_array), np.asarray(indexes, dtype=np.intp), axis=0)
+
+    return sliced_array
+
+
 def keep_only_duplicates(input_list: list):
     """This function removes all unique values from input_list and keeps only the duplicates
     Args:
@@ -275,6 +870,154 @@ def keep_only_duplicates(input_list: list):
     return list_only_with_duplicates
     
 
+def _as_scalar_array(input_list: Union[list, np.ndarray]) -> Union[np.ndarray, None]:
+    """This function converts the input list to a 1D numpy array, if all its items are scalars of the same type (numbers or strings)
+    Args:
+        input_list (list): input list (or array)
+    Returns:
+        scalar_array (np.ndarray): input list as 1D array; None if the items can't be compared as numpy scalars
+    """
+    if isinstance(input_list, np.ndarray):
+        return input_list if input_list.ndim == 1 and input_list.dtype.kind in "biufUS" else None
+    item_types = set(map(type, input_list))
+    if len(item_types) != 1:  # e.g. [1, "1"] would become ["1", "1"]
+        return None
+    item_type = item_types.pop()
+    if not (item_type in (bool, int, float, str, bytes) or issubclass(item_type, np.generic)):
+        return None
+    scalar_array = np.asarray(input_list)
+
+    return scalar_array if scalar_array.ndim == 1 and scalar_array.dtype.kind in "biufUS" else None  # e.g. huge ints become objects
+
+
+def _set_operation_with_numpy(arrays: List[np.ndarray], operation: str) -> tuple:
+    """This function is the numpy implementation of multi_list_set_operation (see it for the arguments)
+    Returns:
+        values (np.ndarray): resulting values, sorted in ascending order
+        idxs (np.ndarray): position of the first occurrence of each value
+    """
+    if operation in ("intersection", "difference"):
+        values, idxs = np.unique(arrays[0], return_index=True)
+        if operation == "intersection":
+            for other_array in arrays[1:]:
+                is_common = np.isin(values, other_array)
+                values, idxs = values[is_common], idxs[is_common]
+        elif len(arrays) > 1:
+            is_only_in_first = ~np.isin(values, np.concatenate(arrays[1:]))
+            values, idxs = values[is_only_in_first], idxs[is_only_in_first]
+    else:
+        values, idxs, counts = np.unique(np.concatenate(arrays), return_index=True, return_counts=True)
+        if operation == "duplicates":
+            is_duplicate = counts > 1
+            values, idxs = values[is_duplicate], idxs[is_duplicate]
+
+    return values, idxs
+
+
+def _set_operation_with_sets(lists: List[list], operation: str, keep_order: bool, sort: bool, return_indices: bool) -> tuple:
+    """This function is the set-based implementation of multi_list_set_operation (see it for the arguments); items only
+    need to be hashable. The set operations run at C speed, and the positions of first occurrence are only computed
+    when they are needed (keep_order, return_indices or items that can't be sorted)
+    Returns:
+        values (list): resulting values
+        idxs (list): position of the first occurrence of each value; None if return_indices is False
+    """
+    if operation in ("intersection", "difference"):
+        sequence = lists[0]
+        first_set = set(sequence)  # type: set
+        values = list(first_set.intersection(*lists[1:]) if operation == "intersection" else first_set.difference(*lists[1:]))
+    else:
+        sequence = list(itertools.chain.from_iterable(lists))
+        if operation == "unique":
+            values = list(set(sequence))
+        else:
+            values = [item for item, count in Counter(sequence).items() if count > 1]
+
+    first_positions = None  # type: dict
+    if keep_order or return_indices:
+        # building the dict from the reversed sequence leaves the position of the first occurrence of each item
+        first_positions = dict(zip(reversed(sequence), range(len(sequence) - 1, -1, -1)))
+    if keep_order:
+        values.sort(key=first_positions.__getitem__)
+    elif sort:
+        try:
+            values.sort()
+        except TypeError:  # items are not comparable: return them in order of first occurrence
+            first_positions = first_positions or dict(zip(reversed(sequence), range(len(sequence) - 1, -1, -1)))
+            values.sort(key=first_positions.__getitem__)
+    idxs = [first_positions[item] for item in values] if return_indices else None
+
+    return values, idxs
+
+
+def multi_list_set_operation(lists: List[list],
+                             operation: str,
+                             keep_order: bool = False,
+                             return_indices: bool = False,
+                             sort: Optional[bool] = None) -> Union[list, tuple]:
+    """This function applies a set operation to any number of lists:
+        "intersection": values that are in all lists (like find_common_elements)
+        "difference": values of the first list that are in none of the other lists (like find_difference_list)
+        "unique": distinct values of all lists (like extract_unique_elements)
+        "duplicates": values that occur more than once across all lists (like keep_only_duplicates)
+    When all the (non-empty) inputs are 1D numeric numpy arrays with the same dtype kind (e.g. all integers or all
+    floats), they are processed with sorted numpy arrays (np.unique, np.isin), which also gives sorted values and their
+    positions at no extra cost. Everything else goes through python sets: string arrays are converted with tolist()
+    first (np.unique sorts strings more slowly than sets hash them), and plain lists are used as they are, since
+    converting them to arrays costs more than the set operations themselves and would change their semantics (mixed
+    ints/floats promoted to float64, trailing NULs stripped from strings, ...). So this function is about as fast as
+    the two-list helpers it generalizes on lists, and faster than them on numeric arrays
+    Args:
+        lists (List[list]): input lists (or 1D arrays)
+        operation (str): one of "intersection", "difference", "unique", "duplicates"
+        keep_order (bool): if True, values are returned in order of first occurrence; defaults to False
+        return_indices (bool): if True, the positions of the first occurrence of each value are also returned; positions
+            refer to the first list for "intersection" and "difference", and to the concatenation of all lists for
+            "unique" and "duplicates". Defaults to False
+        sort (bool): only used if keep_order is False. If True, values are sorted (when the items are not comparable,
+            they are returned in order of first occurrence); if False, they are returned in arbitrary order, like with
+            find_common_elements. If None (default), values are sorted when all inputs are numpy arrays and returned in
+            arbitrary order otherwise, which avoids the cost of sorting
+    Returns:
+        values (list): resulting values
+        idxs (np.ndarray): positions of the first occurrence of each value; only returned if return_indices is True
+    Raises:
+        ValueError: if operation is unknown or if lists is empty
+    Example:
+        >>> multi_list_set_operation([["s3", "s1", "s2"], ["s2", "s3"], ["s3", "s2", "s9"]], "intersection", keep_order=True, return_indices=True)
+        (['s3', 's2'], array([0, 2]))
+    """
+    if operation not in SET_OPERATIONS:
+        raise ValueError("operation must be one of {}. Got {} instead".format(SET_OPERATIONS, operation))
+    if len(lists) == 0:
+        raise ValueError("At least one list is needed")
+
+    non_empty_lists = [input_list for input_list in lists if len(input_list) > 0]
+    only_arrays = len(non_empty_lists) > 0 and all(isinstance(input_list, np.ndarray) for input_list in non_empty_lists)
+    can_use_numpy = (only_arrays
+                     and all(input_list.ndim == 1 for input_list in non_empty_lists)
+                     and len({input_list.dtype.kind for input_list in non_empty_lists}) == 1  # e.g. no int64 mixed with uint64 (-> float64)
+                     and non_empty_lists[0].dtype.kind in "biuf")
+    if can_use_numpy:
+        empty_array = np.array([], dtype=non_empty_lists[0].dtype)  # empty inputs must not promote the dtype of the others
+        arrays = [input_list if len(input_list) > 0 else empty_array for input_list in lists]
+        values, idxs = _set_operation_with_numpy(arrays, operation)
+        if keep_order:
+            order = np.argsort(idxs, kind="stable")
+            values, idxs = values[order], idxs[order]
+        values = values.tolist()  # numpy scalars -> python scalars
+    else:
+        # 1D arrays -> lists of python scalars, which hash faster than numpy scalars (and are returned like above)
+        lists = [input_list.tolist() if isinstance(input_list, np.ndarray) and input_list.ndim == 1 else input_list for input_list in lists]
+        values, idxs = _set_operation_with_sets(lists, operation, keep_order, only_arrays if sort is None else sort, return_indices)
+        idxs = np.asarray(idxs, dtype=np.intp) if return_indices else None
+
+    if return_indices:
+        return values, idxs
+
+    return values
+
+
 def check_if_string_is_in_any_item_of_list(input_list: list, match_string: str) -> bool:
     """This function checks whether match_string is in any of the items of input_list;
     if yes, it returns True, otherwise it returns False.
@@ -284,6 +1027,98 @@ def check_if_string_is_in_any_item_of_list(input_list: list, match_string: str)
     Returns:
         list_contains_match_string (bool): True if list contains match_string; False otherwise
     """
-    list_contains_match_string = bool([item for item in input_list if(match_string in item)])
+    list_contains_match_string = any(match_string in item for item in input_list)  # stops at the first match
     
     return list_contains_match_string
+
+
+@functools.lru_cache(maxsize=128)
+def _compile_patterns(patterns: Tuple[str, ...], regex: bool, ignore_case: bool) -> Tuple[Callable[[str], bool], Tuple[Any, ...]]:
+    """This function compiles the input patterns once (it's cached, so repeated calls with the same patterns don't
+    recompile anything). Plain substrings are escaped and combined into one alternation, so each item is scanned only
+    once; regular expressions are compiled separately, since joining them would break inline global flags (e.g. "(?i)")
+    and shift the numbers of their groups and backreferences
+    Args:
+        patterns (tuple): patterns to compile
+        regex (bool): if True, patterns are regular expressions; otherwise they are plain substrings
+        ignore_case (bool): whether the matching is case-insensitive
+    Returns:
+        matches_any (Callable[[str], bool]): function that returns True if an item matches at least one pattern
+        single_patterns (tuple): one compiled pattern per input pattern, in the same order
+    """
+    flags = re.IGNORECASE if ignore_case else 0
+    single_patterns = tuple(re.compile(pattern if regex else re.escape(pattern), flags) for pattern in patterns)
+    if regex:
+        def matches_any(item: str) -> bool:
+            return any(single_pattern.search(item) is not None for single_pattern in single_patterns)
+    else:
+        sources = sorted((re.escape(pattern) for pattern in patterns), key=len, reverse=True)  # longest first, so that overlapping needles don't shadow each other
+        combined_search = re.compile("|".join(sources), flags).search
+
+        def matches_any(item: str) -> bool:
+            return combined_search(item) is not None
+
+    return matches_any, single_patterns
+
+
+def _as_pattern_tuple(patterns: Union[str, Iterable[str]]) -> Tuple[str, ...]:
+    """This function normalizes one pattern or an iterable of patterns into a hashable tuple (needed by the lru_cache)"""
+    patterns = (patterns,) if isinstance(patterns, str) else tuple(patterns)
+    assert patterns, "At least one pattern is needed"
+
+    return patterns
+
+
+def any_item_matches(input_items: Iterable[str],
+                     patterns: Union[str, Iterable[str]],
+                     regex: bool = False,
+                     ignore_case: bool = False) -> bool:
+    """This function checks whether any of the input items contains any of the patterns. Substrings are tested at
+    once with one combined compiled regex (see _compile_patterns), and the function returns as soon as the first match
+    is found, so it also works on (possibly very long) generators, e.g. os.scandir or glob.iglob
+    Args:
+        input_items (Iterable[str]): items (e.g. file paths) where we search for a match
+        patterns (str or Iterable[str]): one or more substrings (or regular expressions if regex is True)
+        regex (bool): if True, patterns are treated as regular expressions; defaults to False (plain substrings)
+        ignore_case (bool): whether the matching is case-insensitive; defaults to False
+    Returns:
+        match_found (bool): True if at least one item matches at least one pattern; False otherwise
+    Example:
+        >>> any_item_matches(glob.iglob("/data/**/*", recursive=True), ["T1w", "FLAIR"])
+        True
+    """
+    matches_any, _ = _compile_patterns(_as_pattern_tuple(patterns), regex, ignore_case)
+    match_found = any(map(matches_any, input_items))
+
+    return match_found
+
+
+def iter_matching_items(input_items: Iterable[str],
+                        patterns: Union[str, Iterable[str]],
+                        regex: bool = False,
+                        ignore_case: bool = False,
+                        return_patterns: bool = False) -> Iterator[Union[str, Tuple[str, List[str]]]]:
+    """This function lazily yields the input items that contain at least one of the patterns. Items are streamed,
+    so the input can be a generator (e.g. a directory listing) and the output can be consumed one item at a time
+    Args:
+        input_items (Iterable[str]): items (e.g. file paths) to filter
+        patterns (str or Iterable[str]): one or more substrings (or regular expressions if regex is True)
+        regex (bool): if True, patterns are treated as regular expressions; defaults to False (plain substrings)
+        ignore_case (bool): whether the matching is case-insensitive; defaults to False
+        return_patterns (bool): if True, yield (item, matched_patterns) tuples, where matched_patterns lists every
+                                input pattern found in item (in the order of patterns); defaults to False
+    Yields:
+        item (str) or (item, matched_patterns) (tuple): matching items
+    Example:
+        >>> list(iter_matching_items(["sub-01_T1w.nii", "sub-01_dwi.nii"], ["T1w", "sub-01"], return_patterns=True))
+        [('sub-01_T1w.nii', ['T1w', 'sub-01']), ('sub-01_dwi.nii', ['sub-01'])]
+    """
+    patterns = _as_pattern_tuple(patterns)
+    matches_any, single_patterns = _compile_patterns(patterns, regex, ignore_case)
+    for item in input_items:
+        if not matches_any(item):  # for substrings, one scan rejects the (usually many) items that match nothing
+            continue
+        if return_patterns:
+            yield item, [pattern for pattern, compiled in zip(patterns, single_patterns) if compiled.search(item)]
+        else:
+            yield item
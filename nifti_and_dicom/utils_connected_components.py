@@ -0,0 +1,212 @@
+import os
+import functools
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import nibabel as nib
+import SimpleITK as sitk
+import cc3d
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from utils_nifti_and_dicom import iter_executor_results
+
+
+def label_components(mask: np.ndarray, connectivity: int = 26) -> Tuple[np.ndarray, int]:
+    """This function labels the connected components of a binary mask (all nonzero voxels are foreground)
+    Args:
+        mask: 2D or 3D binary mask
+        connectivity: voxel connectivity; 4 or 8 for 2D masks, 6, 18 or 26 for 3D masks. Defaults to 26
+    Returns:
+        labels: array with the same shape as mask, where the voxels of the i-th component have value i (0 = background)
+        nb_components: number of connected components
+    """
+    if mask.ndim == 2 and connectivity not in (4, 8):
+        connectivity = 8
+    labels, nb_components = cc3d.connected_components(mask != 0, connectivity=connectivity, return_N=True)
+
+    return labels, int(nb_components)
+
+
+def compute_component_stats(labels: np.ndarray,
+                            nb_components: Optional[int] = None,
+                            spacing: Iterable[float] = None) -> Dict[str, np.ndarray]:
+    """This function computes the statistics of all the components of a labeled mask in a single pass over the
+    volume (cc3d.statistics), instead of one np.where per label
+    Args:
+        labels: labeled mask (e.g. output of label_components), with labels 1..nb_components and 0 as background
+        nb_components: number of components; defaults to labels.max()
+        spacing: voxel spacing (in mm) along each axis of labels, in the axis order of the array (for arrays obtained
+            with sitk.GetArrayFromImage, that's image.GetSpacing()[::-1]); defaults to 1 mm along every axis
+    Returns:
+        component_stats: dict with the following arrays, where the i-th row refers to the component with label i+1
+            - "labels" (nb_components,): label of each component
+            - "voxel_counts" (nb_components,): number of voxels of each component
+            - "volumes_mm3" (nb_components,): physical volume of each component (voxel count * voxel volume)
+            - "bbox_min" / "bbox_max" (nb_components, ndim): first and last (inclusive) voxel index of the bounding box
+            - "centroids" (nb_components, ndim): centroid of each component, in voxel coordinates
+            - "centroids_mm" (nb_components, ndim): centroid of each component, in mm (voxel coordinates * spacing)
+        Labels without voxels get a zero count, an empty bounding box (bbox_min > bbox_max) and a nan centroid
+    Example:
+        >>> labels, nb_components = label_components(mask)
+        >>> stats = compute_component_stats(labels, nb_components, spacing=nii_obj.header.get_zooms()[:3])
+        >>> largest_bbox = get_component_bounding_boxes(stats)[np.argmax(stats["voxel_counts"])]
+    """
+    spacing = np.ones(labels.ndim) if spacing is None else np.asarray(tuple(spacing)[:labels.ndim], dtype=np.float64)
+    assert spacing.size == labels.ndim, "spacing must have {} values; got {}".format(labels.ndim, spacing.size)
+    if labels.dtype.kind != "u":  # cc3d works on unsigned labels
+        labels = labels.astype(np.uint32)
+    cc3d_stats = cc3d.statistics(np.ascontiguousarray(labels))
+    nb_found = len(cc3d_stats["voxel_counts"])  # background included
+    if nb_components is None:
+        nb_components = nb_found - 1
+
+    # rows 1..nb_components; labels above labels.max() are missing from cc3d_stats and stay empty
+    nb_rows = min(nb_found, nb_components + 1)
+    voxel_counts = np.zeros(nb_components + 1, dtype=np.int64)
+    voxel_counts[:nb_rows] = cc3d_stats["voxel_counts"][:nb_rows]
+    bbox_min = np.tile(np.asarray(labels.shape, dtype=np.intp), (nb_components + 1, 1))
+    bbox_max = np.full((nb_components + 1, labels.ndim), -1, dtype=np.intp)
+    centroids = np.full((nb_components + 1, labels.ndim), np.nan)
+    for label in np.flatnonzero(voxel_counts[:nb_rows]):
+        bounding_box = cc3d_stats["bounding_boxes"][label]  # tuple of slices, one per axis
+        bbox_min[label] = [axis_slice.start for axis_slice in bounding_box]
+        bbox_max[label] = [axis_slice.stop - 1 for axis_slice in bounding_box]
+        centroids[label] = cc3d_stats["centroids"][label]
+
+    component_stats = {"labels": np.arange(1, nb_components + 1),
+                       "voxel_counts": voxel_counts[1:],
+                       "volumes_mm3": voxel_counts[1:] * float(np.prod(spacing)),
+                       "bbox_min": bbox_min[1:],
+                       "bbox_max": bbox_max[1:],
+                       "centroids": centroids[1:],
+                       "centroids_mm": centroids[1:] * spacing}
+
+    return component_stats
+
+
+def get_component_bounding_boxes(component_stats: Dict[str, np.ndarray]) -> List[Tuple[slice, ...]]:
+    """This function converts the bounding boxes of compute_component_stats into tuples of slices (like
+    scipy.ndimage.find_objects), so that each component can be cropped with labels[bounding_box]
+    Args:
+        component_stats: output of compute_component_stats
+    Returns:
+        bounding_boxes: one tuple of slices per component
+    """
+    bounding_boxes = [tuple(slice(int(lo), int(hi) + 1) for lo, hi in zip(bbox_min, bbox_max))
+                      for bbox_min, bbox_max in zip(component_stats["bbox_min"], component_stats["bbox_max"])]
+
+    return bounding_boxes
+
+
+def filter_components(labels: np.ndarray,
+                      component_stats: Dict[str, np.ndarray],
+                      keep_largest_k: Optional[int] = None,
+                      min_volume_mm3: Optional[float] = None,
+                      relabel: bool = True) -> np.ndarray:
+    """This function keeps only the largest components and/or the components above a minimum physical volume.
+    The kept components are selected on the precomputed statistics and the labels are remapped with a single
+    lookup-table indexing (labels_to_keep[labels]), instead of one comparison per component
+    Args:
+        labels: labeled mask (e.g. output of label_components)
+        component_stats: output of compute_component_stats for labels
+        keep_largest_k: if not None, keep only the k components with the largest volume
+        min_volume_mm3: if not None, drop the components whose volume is below this threshold (in mm³)
+        relabel: if True, the kept components are relabeled 1..n from the largest to the smallest;
+                 otherwise they keep their original label. Defaults to True
+    Returns:
+        filtered_labels: labeled mask that only contains the kept components (use filtered_labels > 0 to get a binary mask)
+    """
+    volumes = component_stats["volumes_mm3"]
+    kept = np.argsort(-volumes, kind="stable")  # indexes of the components, from the largest to the smallest
+    if min_volume_mm3 is not None:
+        kept = kept[volumes[kept] >= min_volume_mm3]
+    if keep_largest_k is not None:
+        kept = kept[:keep_largest_k]
+
+    lookup_table = np.zeros(volumes.size + 1, dtype=labels.dtype)
+    kept_labels = component_stats["labels"][kept]
+    lookup_table[kept_labels] = np.arange(1, kept.size + 1) if relabel else kept_labels
+    filtered_labels = lookup_table[labels]
+
+    return filtered_labels
+
+
+def analyze_mask_components(mask: Union[np.ndarray, nib.Nifti1Image, sitk.Image],
+                            spacing: Iterable[float] = None,
+                            connectivity: int = 26) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """This function labels a binary mask once and computes the statistics of all its components
+    Args:
+        mask: binary mask, either as numpy array, as nibabel image or as sitk image. For images, the spacing is read
+            from the header; sitk images are converted with sitk.GetArrayFromImage, so labels and statistics are in
+            (z, y, x) order and the sitk spacing (x, y, z) is reversed accordingly
+        spacing: voxel spacing (in mm) of mask, in the axis order of the numpy array; if None, it's read from the
+            image header (or 1 mm for numpy arrays)
+        connectivity: voxel connectivity; 6, 18 or 26 for 3D masks (4 or 8 for 2D masks). Defaults to 26
+    Returns:
+        labels: labeled mask
+        component_stats: output of compute_component_stats
+    Example:
+        >>> labels, stats = analyze_mask_components(nib.load("lesion_mask.nii.gz"))
+        >>> lesions_mask = filter_components(labels, stats, min_volume_mm3=10) > 0
+    """
+    if isinstance(mask, nib.Nifti1Image):
+        spacing = mask.header.get_zooms()[:3] if spacing is None else spacing
+        mask = np.asanyarray(mask.dataobj)
+    elif isinstance(mask, sitk.Image):
+        spacing = mask.GetSpacing()[::-1] if spacing is None else spacing  # numpy arrays of sitk images are (z, y, x)
+        mask = sitk.GetArrayFromImage(mask)
+    labels, nb_components = label_components(mask, connectivity=connectivity)
+    component_stats = compute_component_stats(labels, nb_components, spacing=spacing)
+
+    return labels, component_stats
+
+
+def _analyze_mask_file_worker(mask_path: str, connectivity: int) -> Tuple[str, Optional[Dict[str, np.ndarray]], Optional[Exception]]:
+    """This function computes the component statistics of one mask file and catches any error, so that one corrupted
+    file does not abort a batch
+    Args:
+        mask_path: path of the mask (any format readable by nibabel, e.g. .nii.gz)
+        connectivity: voxel connectivity
+    Returns:
+        mask_path: input path, to match results and inputs when they are yielded out of order
+        component_stats: output of compute_component_stats; None if an error occurred
+        error: exception raised while processing the mask; None if it succeeded
+    """
+    try:
+        _, component_stats = analyze_mask_components(nib.load(mask_path), connectivity=connectivity)
+        return mask_path, component_stats, None
+    except Exception as error:  # noqa: the error is handed back to the caller
+        return mask_path, None, error
+
+
+def analyze_masks_components(mask_paths: Iterable[str],
+                             connectivity: int = 26,
+                             workers: Optional[int] = None,
+                             backend: str = "process",
+                             ordered: bool = True) -> Iterator[Tuple[str, Optional[Dict[str, np.ndarray]], Optional[Exception]]]:
+    """This function computes the component statistics of many mask files in parallel and streams the results back
+    as soon as they are ready
+    Args:
+        mask_paths: paths of the masks; can be a generator
+        connectivity: voxel connectivity; defaults to 26
+        workers: number of parallel workers; defaults to the number of cpus
+        backend: either "process" (one process per worker) or "thread" (one thread per worker); defaults to "process"
+        ordered: if True, results are yielded in input order; if False, in completion order. Defaults to True
+    Returns:
+        results: iterator of (mask_path, component_stats, error) tuples, where component_stats is None and error is
+            the raised exception if the mask could not be processed
+    Raises:
+        ValueError: if backend is neither "process" nor "thread"
+    Example:
+        >>> for path, stats, error in analyze_masks_components(glob.glob("/data/*/mask.nii.gz"), workers=8):
+        ...     if error is None:
+        ...         print(path, stats["volumes_mm3"].sum())
+    """
+    if backend not in ("process", "thread"):
+        raise ValueError("backend can only be 'process' or 'thread'. Got {} instead".format(backend))
+    workers = workers or os.cpu_count() or 1
+    worker_fn = functools.partial(_analyze_mask_file_worker, connectivity=connectivity)
+    executor = ProcessPoolExecutor(max_workers=workers) if backend == "process" else ThreadPoolExecutor(max_workers=workers)  # type: Executor
+
+    try:
+        yield from iter_executor_results(executor, worker_fn, mask_paths, max_in_flight=2 * workers, ordered=ordered)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
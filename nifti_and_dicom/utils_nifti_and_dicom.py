@@ -1,23 +1,72 @@
 import os
+import functools
+import itertools
+import hashlib
+import sqlite3
+import warnings
+from contextlib import closing
+from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
 import SimpleITK as sitk
 import nibabel as nib
-from typing import Iterator, Dict, List, Tuple
+import pydicom
+from typing import Iterator, Iterable, Callable, Dict, List, Tuple, Optional, Any
 
+# default location of the persistent index of the dicom series (see index_dcm_series)
+DCM_SERIES_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".cache", "python_utils", "dcm_series_index.sqlite")
 
-def resample_volume(volume_path: str,
-                    new_spacing: List,
-                    out_path: str,
-                    interpolator=sitk.sitkLinear) -> Tuple[sitk.Image, nib.Nifti1Image, np.ndarray]:
-    """This function resamples the input volume to a specified voxel spacing
+
+def sitk_image_to_nibabel(volume_sitk: sitk.Image, copy: bool = False) -> Tuple[nib.Nifti1Image, np.ndarray]:
+    """This function converts a sitk.Image to a nibabel object without writing it to disk. By default, the voxel
+    array is a read-only view on the sitk buffer (no copy), so the input sitk.Image must be kept alive as long as the
+    array is used. The affine and the header mimic what SimpleITK writes to disk, so the output is identical to the
+    one we would get with sitk.WriteImage followed by nib.load
+    Args:
+        volume_sitk: input volume as sitk object; only scalar (i.e. single-component) images are supported
+        copy: if True, the voxel array is a writable copy, independent of volume_sitk; defaults to False
+    Returns:
+        volume_nii_obj: input volume as nib object
+        volume_nii: input volume as numpy array, with nibabel axes order (i.e. x, y, z[, t])
+    Raises:
+        ValueError: if the input image has more than one component per pixel
+    """
+    if volume_sitk.GetNumberOfComponentsPerPixel() != 1:
+        raise ValueError("Only scalar images are supported; got {} components per pixel".format(volume_sitk.GetNumberOfComponentsPerPixel()))
+
+    # sitk arrays are ordered as (t,) z, y, x; reversing the axes gives the nibabel order without copying the buffer
+    if copy:
+        volume_nii = sitk.GetArrayFromImage(volume_sitk).T  # type: np.ndarray
+    else:
+        volume_nii = sitk.GetArrayViewFromImage(volume_sitk).T  # read-only
+
+    # build the affine from the first 3 spatial dims (like the NIfTI writer of ITK); ITK works in LPS, NIfTI in RAS
+    dims = volume_sitk.GetDimension()
+    direction = np.asarray(volume_sitk.GetDirection()).reshape(dims, dims)[:3, :3]
+    spacing = np.asarray(volume_sitk.GetSpacing())
+    affine = np.eye(4)
+    affine[:3, :3] = direction * spacing[:3]  # scale each column of the direction matrix by the corresponding spacing
+    affine[:3, 3] = volume_sitk.GetOrigin()[:3]
+    affine[:2, :] *= -1  # LPS -> RAS
+
+    volume_nii_obj = nib.Nifti1Image(volume_nii, affine)  # type: nib.Nifti1Image
+    volume_nii_obj.set_qform(affine, code=1)  # ITK writes both qform and sform as scanner coordinates
+    volume_nii_obj.set_sform(affine, code=1)
+    volume_nii_obj.header.set_zooms(tuple(spacing))  # also stores the time spacing of 4D volumes
+    volume_nii_obj.header.set_xyzt_units(xyz="mm", t="sec")
+
+    return volume_nii_obj, volume_nii
+
+
+def _resample_sitk_volume(volume_path: str, new_spacing: List, interpolator=sitk.sitkLinear) -> sitk.Image:
+    """This function reads the input volume and resamples it to a specified voxel spacing, keeping origin and direction
     Args:
         volume_path: input volume path
         new_spacing: desired voxel spacing that we want
-        out_path: path where we temporarily save the resampled output volume
         interpolator: interpolator that we want to use (e.g. 1= NearNeigh., 2=linear, ...)
     Returns:
         resampled_volume_sitk_obj: resampled volume as sitk object
-        resampled_volume_nii_obj: resampled volume as nib object
-        resampled_volume_nii: resampled volume as numpy array
     """
     volume = sitk.ReadImage(volume_path)  # read volume
     original_size = volume.GetSize()  # extract size
@@ -26,14 +75,272 @@ def resample_volume(volume_path: str,
     resampled_volume_sitk_obj = sitk.Resample(volume, new_size, sitk.Transform(), interpolator,
                                               volume.GetOrigin(), new_spacing, volume.GetDirection(), 0,
                                               volume.GetPixelID())
-    sitk.WriteImage(resampled_volume_sitk_obj, out_path)  # write sitk volume object to disk
-    resampled_volume_nii_obj = nib.load(out_path)  # type: nib.Nifti1Image # load volume as nibabel object
-    resampled_volume_nii = np.asanyarray(resampled_volume_nii_obj.dataobj)  # type: np.ndarray # convert from nibabel object to np.array
-    os.remove(out_path)  # remove volume from disk to save space
+
+    return resampled_volume_sitk_obj
+
+
+def resample_volume(volume_path: str,
+                    new_spacing: List,
+                    out_path: Optional[str] = None,
+                    interpolator=sitk.sitkLinear,
+                    in_memory: bool = False,
+                    copy: bool = True) -> Tuple[sitk.Image, nib.Nifti1Image, np.ndarray]:
+    """This function resamples the input volume to a specified voxel spacing
+    Args:
+        volume_path: input volume path
+        new_spacing: desired voxel spacing that we want
+        out_path: path where we temporarily save the resampled output volume; only needed if in_memory is False
+        interpolator: interpolator that we want to use (e.g. 1= NearNeigh., 2=linear, ...)
+        in_memory: if True, the nib object and the numpy array are built directly from the sitk object, without
+            the write/read/delete round-trip on disk. Defaults to False
+        copy: only used if in_memory is True. If True (default), the numpy array is a writable copy, like the one
+            read from disk; if False, it is a read-only view on the buffer of resampled_volume_sitk_obj, which saves
+            one copy of the voxels but raises "assignment destination is read-only" on in-place edits
+    Returns:
+        resampled_volume_sitk_obj: resampled volume as sitk object
+        resampled_volume_nii_obj: resampled volume as nib object
+        resampled_volume_nii: resampled volume as numpy array
+    Raises:
+        AssertionError: if in_memory is False and out_path is not specified
+    """
+    assert in_memory or out_path is not None, "out_path must be specified when in_memory is False"
+    resampled_volume_sitk_obj = _resample_sitk_volume(volume_path, new_spacing, interpolator)
+    if in_memory:
+        resampled_volume_nii_obj, resampled_volume_nii = sitk_image_to_nibabel(resampled_volume_sitk_obj, copy=copy)
+    else:
+        sitk.WriteImage(resampled_volume_sitk_obj, out_path)  # write sitk volume object to disk
+        resampled_volume_nii_obj = nib.load(out_path)  # type: nib.Nifti1Image # load volume as nibabel object
+        resampled_volume_nii = np.asanyarray(resampled_volume_nii_obj.dataobj)  # type: np.ndarray # convert from nibabel object to np.array
+        os.remove(out_path)  # remove volume from disk to save space
 
     return resampled_volume_sitk_obj, resampled_volume_nii_obj, resampled_volume_nii
 
 
+def _set_sitk_number_of_threads(nb_threads: int) -> None:
+    """This function sets the default number of threads used by the SimpleITK filters of the current process
+    Args:
+        nb_threads: number of threads that each sitk filter is allowed to use
+    Returns:
+        None
+    """
+    sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(nb_threads)
+
+
+def iter_executor_results(executor: Executor,
+                          fn: Callable,
+                          items: Iterable,
+                          max_in_flight: int,
+                          ordered: bool = True) -> Iterator[Any]:
+    """This function applies fn to every item with the input executor and yields the results as soon as they are
+    available. At most max_in_flight items are submitted at the same time, so results do not pile up in memory
+    when the consumer is slower than the workers
+    Args:
+        executor: thread or process pool executor used to run fn
+        fn: function to apply to each item
+        items: items to process; can be a generator
+        max_in_flight: maximum number of submitted but not yet consumed items
+        ordered: if True, results are yielded in input order; if False, in completion order
+    Returns:
+        results: iterator over the outputs of fn
+    """
+    items = iter(items)
+    if ordered:
+        pending_ordered = deque(executor.submit(fn, item) for item in itertools.islice(items, max_in_flight))
+        while pending_ordered:
+            future = pending_ordered.popleft()
+            result = future.result()
+            for item in itertools.islice(items, 1):  # refill the queue before handing the result to the consumer
+                pending_ordered.append(executor.submit(fn, item))
+            yield result
+    else:
+        pending = {executor.submit(fn, item) for item in itertools.islice(items, max_in_flight)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for item in itertools.islice(items, len(done)):
+                pending.add(executor.submit(fn, item))
+            for future in done:
+                yield future.result()
+
+
+def _resample_volume_worker(volume_path: str,
+                            new_spacing: List,
+                            interpolator=sitk.sitkLinear) -> Tuple[str, Optional[sitk.Image], Optional[Exception]]:
+    """This function resamples one volume in memory and catches any error, so that one corrupted file does not abort a batch.
+    Only the sitk object is returned: the nib object and the numpy array are rebuilt by the caller, so that with the
+    process backend the voxels are pickled (i.e. sent between processes) only once
+    Args:
+        volume_path: input volume path
+        new_spacing: desired voxel spacing that we want
+        interpolator: interpolator that we want to use (e.g. 1= NearNeigh., 2=linear, ...)
+    Returns:
+        volume_path: same as input
+        resampled_volume_sitk_obj: resampled volume as sitk object; None if the resampling failed
+        error: exception raised while resampling; None if the resampling succeeded
+    """
+    try:
+        resampled_volume_sitk_obj = _resample_sitk_volume(volume_path, new_spacing, interpolator)
+    except Exception as error:  # report the error instead of raising it
+        return volume_path, None, error
+
+    return volume_path, resampled_volume_sitk_obj, None
+
+
+def resample_volumes(volume_paths: Iterable[str],
+                     new_spacing: List,
+                     workers: Optional[int] = None,
+                     backend: str = "process",
+                     interpolator=sitk.sitkLinear,
+                     ordered: bool = True,
+                     copy: bool = True) -> Iterator[Tuple[str, Optional[Tuple[sitk.Image, nib.Nifti1Image, np.ndarray]], Optional[Exception]]]:
+    """This function resamples many volumes in parallel to a specified voxel spacing. The volumes are resampled in memory
+    (see resample_volume) and the results are streamed back as soon as they are ready. The number of threads of the sitk
+    filters is divided among the workers, so that the cores are not oversubscribed
+    Args:
+        volume_paths: paths of the input volumes; can be a generator
+        new_spacing: desired voxel spacing that we want
+        workers: number of parallel workers; defaults to the number of cpus
+        backend: either "process" (one process per worker) or "thread" (one thread per worker); defaults to "process"
+        interpolator: interpolator that we want to use (e.g. 1= NearNeigh., 2=linear, ...)
+        ordered: if True, results are yielded in input order; if False, in completion order. Defaults to True
+        copy: whether the numpy arrays are writable copies or read-only views on the sitk buffers (see resample_volume)
+    Returns:
+        results: iterator of (volume_path, resampled, error) tuples, where resampled is the output of resample_volume
+            (None if the resampling failed) and error is the exception raised for that volume (None if it succeeded)
+    Raises:
+        ValueError: if backend is neither "process" nor "thread"
+    Example:
+        >>> for path, resampled, error in resample_volumes(paths, [1., 1., 1.], workers=8):
+        ...     if error is not None:
+        ...         print("Could not resample {}: {}".format(path, error))
+    """
+    if backend not in ("process", "thread"):
+        raise ValueError("backend can only be 'process' or 'thread'. Got {} instead".format(backend))
+    nb_cpus = os.cpu_count() or 1
+    workers = workers or nb_cpus
+    sitk_threads_per_worker = max(1, nb_cpus // workers)
+    worker_fn = functools.partial(_resample_volume_worker, new_spacing=new_spacing, interpolator=interpolator)
+
+    previous_sitk_threads = None
+    if backend == "process":
+        executor = ProcessPoolExecutor(max_workers=workers,
+                                       initializer=_set_sitk_number_of_threads,
+                                       initargs=(sitk_threads_per_worker,))  # type: Executor
+    else:  # threads share the global sitk setting, so we change it only for the duration of the batch
+        previous_sitk_threads = sitk.ProcessObject.GetGlobalDefaultNumberOfThreads()
+        _set_sitk_number_of_threads(sitk_threads_per_worker)
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+    try:
+        for volume_path, resampled_volume_sitk_obj, error in iter_executor_results(executor, worker_fn, volume_paths,
+                                                                                   max_in_flight=2 * workers, ordered=ordered):
+            if error is not None:
+                yield volume_path, None, error
+            else:  # the nib object and the array are cheap to rebuild from the sitk object in this process
+                yield volume_path, (resampled_volume_sitk_obj, *sitk_image_to_nibabel(resampled_volume_sitk_obj, copy=copy)), None
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        if previous_sitk_threads is not None:
+            _set_sitk_number_of_threads(previous_sitk_threads)
+
+
+def _nonzero_projections(input_volume: np.ndarray) -> List[np.ndarray]:
+    """This function computes, for every axis of the input volume, which indexes contain at least one nonzero value
+    Args:
+        input_volume: volume that we want to inspect
+    Returns:
+        projections: one boolean array per axis; projections[axis][idx] is True if the slice idx along axis has nonzero values
+    """
+    if input_volume.ndim == 1:
+        return [input_volume != 0]
+
+    # only two full passes over the volume: the projections of axes 1, ..., N-1 are derived from the (smaller) projection along axis 0
+    nonzero_along_first_axis = np.any(input_volume, axis=0)  # type: np.ndarray
+    projections = [np.any(input_volume, axis=tuple(range(1, input_volume.ndim)))]
+    for axis in range(nonzero_along_first_axis.ndim):
+        other_axes = tuple(ax for ax in range(nonzero_along_first_axis.ndim) if ax != axis)
+        projections.append(np.any(nonzero_along_first_axis, axis=other_axes) if other_axes else nonzero_along_first_axis)
+
+    return projections
+
+
+def _nonzero_projections_by_slabs(input_volume: Any, slab_size: int = 8) -> List[np.ndarray]:
+    """This function is like _nonzero_projections, but it reads the input volume one slab at a time along its last axis,
+    so that volumes that are not in RAM (e.g. LazyNiftiVolume) are never fully materialized
+    Args:
+        input_volume: volume that we want to inspect; it must support shape and basic slicing
+        slab_size: number of slices that are read at once; defaults to 8
+    Returns:
+        projections: one boolean array per axis; projections[axis][idx] is True if the slice idx along axis has nonzero values
+    """
+    shape = tuple(input_volume.shape)
+    projections = [np.zeros(size, dtype=bool) for size in shape]
+    for start_idx in range(0, shape[-1], slab_size):
+        slab = np.asanyarray(input_volume[..., start_idx:start_idx + slab_size])
+        for axis, slab_projection in enumerate(_nonzero_projections(slab)):
+            if axis == len(shape) - 1:
+                projections[axis][start_idx:start_idx + slab.shape[-1]] = slab_projection
+            else:
+                projections[axis] |= slab_projection
+
+    return projections
+
+
+def crop_volume_to_nonzero_bbox(input_volume: np.ndarray,
+                                drop_all_empty_slices: bool = False) -> Tuple[np.ndarray, tuple]:
+    """This function crops the input volume to the bounding box of its nonzero values
+    Args:
+        input_volume: N-dimensional volume that we want to crop; it can also be a LazyNiftiVolume, in which case the
+            volume is scanned slab by slab and only the cropped region is loaded in RAM
+        drop_all_empty_slices: if False (default), only the empty borders are removed and the cropped volume is a view
+            (no copy) of input_volume; if True, every slice that only contains zeros is removed, even the ones inside
+            the bounding box (like remove_zeros_ijk_from_volume), and the cropped volume is a copy
+    Returns:
+        cropped_volume: cropped volume
+        crop_idxs: index that produced the crop, i.e. cropped_volume = input_volume[crop_idxs]; it's a tuple of slices
+            if drop_all_empty_slices is False, otherwise an open mesh (see np.ix_). It can be used to apply the same crop
+            to a paired volume (e.g. label_volume[crop_idxs]) or to undo the crop (see uncrop_volume)
+    Example:
+        >>> cropped_volume, crop_idxs = crop_volume_to_nonzero_bbox(brain_volume)
+        >>> cropped_label = label_volume[crop_idxs]
+    """
+    is_in_memory = isinstance(input_volume, np.ndarray)
+    projections = _nonzero_projections(input_volume) if is_in_memory else _nonzero_projections_by_slabs(input_volume)
+    idxs_nonzero_slices = [np.flatnonzero(projection) for projection in projections]
+    bbox_slices = tuple(slice(int(idxs[0]), int(idxs[-1]) + 1) if idxs.size > 0 else slice(0, 0)  # empty slice if the volume only contains zeros
+                        for idxs in idxs_nonzero_slices)
+
+    if drop_all_empty_slices:
+        crop_idxs = np.ix_(*idxs_nonzero_slices)  # type: tuple
+        if is_in_memory:
+            cropped_volume = input_volume[crop_idxs]
+        else:  # first read the bounding box from disk, then drop the interior empty slices in RAM
+            cropped_volume = input_volume[bbox_slices][np.ix_(*[idxs - bbox.start for idxs, bbox in zip(idxs_nonzero_slices, bbox_slices)])]
+    else:
+        crop_idxs = bbox_slices
+        cropped_volume = input_volume[crop_idxs]
+
+    return cropped_volume, crop_idxs
+
+
+def uncrop_volume(cropped_volume: np.ndarray,
+                  crop_idxs: tuple,
+                  original_shape: tuple,
+                  fill_value: Any = 0) -> np.ndarray:
+    """This function undoes the crop performed with crop_volume_to_nonzero_bbox
+    Args:
+        cropped_volume: cropped volume (or any volume with the same shape, e.g. a prediction computed on the crop)
+        crop_idxs: index returned by crop_volume_to_nonzero_bbox
+        original_shape: shape of the volume before cropping
+        fill_value: value used for the voxels that were cropped out; defaults to 0
+    Returns:
+        uncropped_volume: volume with shape original_shape
+    """
+    uncropped_volume = np.full(original_shape, fill_value, dtype=cropped_volume.dtype)
+    uncropped_volume[crop_idxs] = cropped_volume
+
+    return uncropped_volume
+
+
 def remove_zeros_ijk_from_volume(input_volume: np.ndarray) -> np.ndarray:
     """This function removes all the rows, columns and slices of the input volume that only contain zero values.
     Args:
@@ -41,41 +348,9 @@ def remove_zeros_ijk_from_volume(input_volume: np.ndarray) -> np.ndarray:
     Returns:
         cropped_volume: cropped volume (i.e. input volume with zeros removed)
     """
-    def remove_zeros_one_coordinate(input_volume_: np.ndarray, range_spatial_dim: int, spatial_dim: int):
-        idxs_nonzero_slices = []  # will the contain the indexes of all the slices that have nonzero values
-        for idx in range(range_spatial_dim):  # loop over coordinate
-            if spatial_dim == 0:
-                one_slice = input_volume_[idx, :, :]
-            elif spatial_dim == 1:
-                one_slice = input_volume_[:, idx, :]
-            elif spatial_dim == 2:
-                one_slice = input_volume_[:, :, idx]
-            else:
-                raise ValueError("spatial_dim can only be 0, 1, or 2. Got {} instead".format(spatial_dim))
-
-            if np.count_nonzero(one_slice) > 0:  # if the slice has some nonzero values
-                idxs_nonzero_slices.append(idx)  # save slice index
-
-        # retain only indexes with nonzero values from the two input volumes
-        if spatial_dim == 0:
-            cropped_volume_ = input_volume_[idxs_nonzero_slices, :, :]
-        elif spatial_dim == 1:
-            cropped_volume_ = input_volume_[:, idxs_nonzero_slices, :]
-        elif spatial_dim == 2:
-            cropped_volume_ = input_volume_[:, :, idxs_nonzero_slices]
-        else:
-            raise ValueError("spatial_dim can only be 0, 1, or 2. Got {} instead".format(spatial_dim))
-
-        return cropped_volume_
-
     assert len(input_volume.shape) == 3, "The input volume must be 3D"
 
-    # i coordinate
-    cropped_volume = remove_zeros_one_coordinate(input_volume, input_volume.shape[0], spatial_dim=0)
-    # j coordinate
-    cropped_volume = remove_zeros_one_coordinate(cropped_volume, input_volume.shape[1], spatial_dim=1)
-    # k coordinate
-    cropped_volume = remove_zeros_one_coordinate(cropped_volume, input_volume.shape[2], spatial_dim=2)
+    cropped_volume, _ = crop_volume_to_nonzero_bbox(input_volume, drop_all_empty_slices=True)
 
     return cropped_volume
 
@@ -109,15 +384,237 @@ def get_nibabel_header(input_nifti_volume: nib.Nifti1Image,
     return header
 
 
-def read_dcm_series(dcm_dir: str) -> sitk.Image:
+class LazyNiftiVolume:
+    """This class gives lazy access to a nifti volume. The header, the affine and the axes orientations are available
+    right away, while the voxels are only read from disk when they are indexed (e.g. volume[:, :, 10] only reads one
+    slice). Uncompressed and unscaled .nii files are memory-mapped; all other files are read through the nibabel array proxy
+    Example:
+        >>> volume = LazyNiftiVolume("/path/to/bold.nii")
+        >>> volume.shape, volume.orientations
+        ((64, 64, 36, 300), ('R', 'A', 'S'))
+        >>> first_run_volume = volume[..., 0]  # only the first 3D volume is loaded in RAM
+    """
+    def __init__(self, nifti_path: str, mmap: bool = True):
+        """
+        Args:
+            nifti_path: path to the nifti volume
+            mmap: whether to memory-map uncompressed files; defaults to True
+        """
+        self.nifti_path = nifti_path
+        self.nii_obj = nib.load(nifti_path, mmap=mmap)  # type: nib.Nifti1Image # only the header is read here
+        self.header = get_nibabel_header(self.nii_obj)
+        self.affine = self.nii_obj.affine  # type: np.ndarray
+        self.orientations = get_axes_orientations_with_nibabel(self.nii_obj)
+        self.shape = self.nii_obj.shape  # type: tuple
+        self.ndim = len(self.shape)
+
+        proxy = self.nii_obj.dataobj
+        is_scaled = getattr(proxy, "slope", 1.) != 1. or getattr(proxy, "inter", 0.) != 0.
+        if mmap and not is_scaled and not nifti_path.endswith(".gz"):
+            self._voxels = np.asanyarray(proxy)  # np.memmap: pages are only read from disk when they are accessed
+        else:
+            self._voxels = proxy  # nibabel array proxy: each indexing only reads the requested part of the file
+        self.dtype = np.asanyarray(self._voxels[(slice(0, 1),) * self.ndim]).dtype  # read a single voxel to get the (scaled) dtype
+
+    def __getitem__(self, index) -> np.ndarray:
+        """This method reads from disk only the indexed part of the volume (basic slicing; fancy indexing is only supported for memory-mapped files)"""
+        return np.asanyarray(self._voxels[index])
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        """This method loads the whole volume, so that numpy functions can be applied directly (e.g. np.mean(volume))"""
+        volume = np.asanyarray(self._voxels)
+        if dtype is not None:
+            volume = volume.astype(dtype, copy=False)
+        return np.array(volume) if copy else volume
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __repr__(self) -> str:
+        return "LazyNiftiVolume(nifti_path={!r}, shape={}, dtype={})".format(self.nifti_path, self.shape, self.dtype)
+
+    def iter_slabs(self, slab_size: int = 1, axis: int = -1) -> Iterator[Tuple[int, np.ndarray]]:
+        """This method yields the volume one slab at a time, so that only slab_size slices are in RAM at once
+        Args:
+            slab_size: number of slices per slab; defaults to 1
+            axis: axis along which the slabs are taken; defaults to the last axis, which is the contiguous one on disk
+        Returns:
+            slabs: iterator of (start_idx, slab) tuples, where slab contains the slices [start_idx, start_idx + slab_size)
+        """
+        axis = axis % self.ndim
+        for start_idx in range(0, self.shape[axis], slab_size):
+            index = [slice(None)] * self.ndim
+            index[axis] = slice(start_idx, start_idx + slab_size)
+            yield start_idx, self[tuple(index)]
+
+
+def _get_dir_fingerprint(dcm_dir: str) -> str:
+    """This function computes a fingerprint of the files inside dcm_dir from their names, sizes and modification times;
+    the fingerprint changes whenever a file is added, removed or modified
+    Args:
+        dcm_dir: directory of interest
+    Returns:
+        fingerprint: hex digest that identifies the current content of the directory
+    """
+    files_stats = []
+    for entry in os.scandir(dcm_dir):
+        if entry.is_file():
+            entry_stat = entry.stat()
+            files_stats.append((entry.name, entry_stat.st_size, entry_stat.st_mtime_ns))
+    files_stats.sort()
+    fingerprint = hashlib.sha1(repr(files_stats).encode()).hexdigest()
+
+    return fingerprint
+
+
+def _scan_dcm_series(dcm_dir: str) -> Dict[str, List[str]]:
+    """This function groups the dicom files of dcm_dir by series in a single pass over the directory (only a few header
+    tags of each file are parsed) and sorts the files of each series like GDCM does, i.e. by position along the slice
+    normal, then by InstanceNumber, then by file name. Files that are not dicom are skipped
+    Args:
+        dcm_dir: directory where dicom files are stored
+    Returns:
+        series: it maps each SeriesInstanceUID (sorted) to the sorted list of its dicom files
+    """
+    tags = ["SeriesInstanceUID", "ImagePositionPatient", "ImageOrientationPatient", "InstanceNumber"]
+    sort_keys_per_series = {}  # type: Dict[str, List[Tuple[float, float, str]]]
+    for entry in os.scandir(dcm_dir):
+        if not entry.is_file():
+            continue
+        try:
+            ds = pydicom.dcmread(entry.path, stop_before_pixels=True, specific_tags=tags)
+        except (pydicom.errors.InvalidDicomError, OSError):
+            continue
+        if "SeriesInstanceUID" not in ds:
+            continue
+        position_along_normal = 0.
+        if "ImagePositionPatient" in ds and "ImageOrientationPatient" in ds:
+            orientation = np.asarray(ds.ImageOrientationPatient, dtype=np.float64)
+            position_along_normal = float(np.dot(np.cross(orientation[:3], orientation[3:]), np.asarray(ds.ImagePositionPatient, dtype=np.float64)))
+        instance_number = float(ds.InstanceNumber) if ds.get("InstanceNumber") is not None else 0.
+        sort_keys_per_series.setdefault(str(ds.SeriesInstanceUID), []).append((position_along_normal, instance_number, entry.path))
+
+    series = {series_uid: [file_path for _, _, file_path in sorted(sort_keys_per_series[series_uid])]
+              for series_uid in sorted(sort_keys_per_series)}
+
+    return series
+
+
+def index_dcm_series(dcm_dir: str,
+                     index_path: Optional[str] = None,
+                     force_rescan: bool = False) -> Dict[str, List[str]]:
+    """This function returns all the dicom series contained in dcm_dir. The series are stored in a persistent SQLite
+    index keyed by directory path and by a fingerprint of the file modification times, so the (slow) scan of the
+    directory headers is only re-run when the directory content changes
+    Args:
+        dcm_dir: directory where dicom files are stored
+        index_path: path of the SQLite index; defaults to DCM_SERIES_INDEX_PATH
+        force_rescan: if True, the directory is re-scanned even if its index is up to date; defaults to False
+    Returns:
+        series: it maps each SeriesInstanceUID to the sorted list of its dicom files; series are sorted by SeriesInstanceUID
+    """
+    dcm_dir = os.path.abspath(dcm_dir)
+    index_path = index_path or DCM_SERIES_INDEX_PATH
+    if os.path.dirname(index_path) and not os.path.exists(os.path.dirname(index_path)):  # if index folder does not exist
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)  # create it
+    fingerprint = _get_dir_fingerprint(dcm_dir)
+
+    with closing(sqlite3.connect(index_path, timeout=60)) as connection:
+        with connection:  # commit on exit
+            connection.execute("CREATE TABLE IF NOT EXISTS directories (dir_path TEXT PRIMARY KEY, fingerprint TEXT NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS series_files (dir_path TEXT NOT NULL, series_position INTEGER NOT NULL, "
+                               "series_uid TEXT NOT NULL, file_position INTEGER NOT NULL, file_path TEXT NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS series_files_dir_path ON series_files (dir_path)")
+
+        row = connection.execute("SELECT fingerprint FROM directories WHERE dir_path = ?", (dcm_dir,)).fetchone()
+        if row is not None and row[0] == fingerprint and not force_rescan:  # index is up to date
+            series = {}  # type: Dict[str, List[str]]
+            for series_uid, file_path in connection.execute("SELECT series_uid, file_path FROM series_files WHERE dir_path = ? "
+                                                            "ORDER BY series_position, file_position", (dcm_dir,)):
+                series.setdefault(series_uid, []).append(file_path)
+            return series
+
+        series = _scan_dcm_series(dcm_dir)  # (re-)scan the directory
+        with connection:  # commit on exit
+            connection.execute("DELETE FROM series_files WHERE dir_path = ?", (dcm_dir,))
+            connection.execute("INSERT OR REPLACE INTO directories (dir_path, fingerprint) VALUES (?, ?)", (dcm_dir, fingerprint))
+            connection.executemany("INSERT INTO series_files (dir_path, series_position, series_uid, file_position, file_path) VALUES (?, ?, ?, ?, ?)",
+                                   ((dcm_dir, series_position, series_uid, file_position, file_path)
+                                    for series_position, (series_uid, file_names) in enumerate(series.items())
+                                    for file_position, file_path in enumerate(file_names)))
+
+    return series
+
+
+def _select_dcm_series(series: Dict[str, List[str]], dcm_dir: str, series_uid: Optional[str] = None) -> List[str]:
+    """This function picks the files of one series out of the output of index_dcm_series or _scan_dcm_series
+    Args:
+        series: it maps each SeriesInstanceUID to the sorted list of its dicom files
+        dcm_dir: directory where the dicom files are stored (only used in messages)
+        series_uid: SeriesInstanceUID of the series of interest; if None, the first series is used (with a warning if
+            dcm_dir contains more than one series)
+    Returns:
+        dicom_names: sorted paths of the dicom files of the series
+    Raises:
+        ValueError: if series is empty, or if series_uid is not in series
+    """
+    if not series:
+        raise ValueError("No dicom series found in {}".format(dcm_dir))
+    if series_uid is None:
+        if len(series) > 1:
+            warnings.warn("{} contains {} series; only the first one is used. Specify series_uid to pick another one".format(dcm_dir, len(series)))
+        series_uid = next(iter(series))
+    if series_uid not in series:
+        raise ValueError("Series {} not found in {}".format(series_uid, dcm_dir))
+
+    return series[series_uid]
+
+
+def get_dcm_series_file_names(dcm_dir: str,
+                              series_uid: Optional[str] = None,
+                              use_index: bool = False,
+                              index_path: Optional[str] = None) -> List[str]:
+    """This function returns the sorted dicom files of one series contained in dcm_dir
+    Args:
+        dcm_dir: directory where dicom files are stored
+        series_uid: SeriesInstanceUID of the series of interest; if None, the first series found is used
+        use_index: if True, the series are looked up in the persistent index (see index_dcm_series) instead of
+            scanning the directory every time; defaults to False
+        index_path: path of the SQLite index; only used if use_index is True
+    Returns:
+        dicom_names: sorted paths of the dicom files of the series
+    Raises:
+        ValueError: if dcm_dir does not contain any dicom series, or if series_uid is not found in dcm_dir
+    """
+    if use_index:
+        dicom_names = _select_dcm_series(index_dcm_series(dcm_dir, index_path=index_path), dcm_dir, series_uid)
+    else:
+        if series_uid is None:
+            dicom_names = list(sitk.ImageSeriesReader.GetGDCMSeriesFileNames(dcm_dir))
+        else:
+            dicom_names = list(sitk.ImageSeriesReader.GetGDCMSeriesFileNames(dcm_dir, series_uid))
+        if not dicom_names:
+            raise ValueError("No dicom series {}found in {}".format("" if series_uid is None else series_uid + " ", dcm_dir))
+
+    return dicom_names
+
+
+def read_dcm_series(dcm_dir: str,
+                    series_uid: Optional[str] = None,
+                    use_index: bool = False,
+                    index_path: Optional[str] = None) -> sitk.Image:
     """This function reads a dicom series with SimpleITK
     Args:
         dcm_dir: directory where dicom files are stored
+        series_uid: SeriesInstanceUID of the series to read; if None (default), the first series found is read
+        use_index: if True, the series files are looked up in the persistent index (see index_dcm_series), so repeated
+            reads skip the scan of the directory; defaults to False
+        index_path: path of the SQLite index; only used if use_index is True
     Returns:
         volume_sitk: volume loaded as sitk.Image
     """
     reader = sitk.ImageSeriesReader()  # create reader
-    dicom_names = reader.GetGDCMSeriesFileNames(dcm_dir)  # read dicom series
+    dicom_names = get_dcm_series_file_names(dcm_dir, series_uid=series_uid, use_index=use_index, index_path=index_path)
     reader.SetFileNames(dicom_names)
 
     volume_sitk = reader.Execute()  # extract sitk.Image
@@ -125,41 +622,193 @@ def read_dcm_series(dcm_dir: str) -> sitk.Image:
     return volume_sitk
 
 
+def read_image_information(file_path: str) -> sitk.ImageFileReader:
+    """This function reads only the header of the input image file (i.e. the pixel data is not decoded)
+    Args:
+        file_path: path to the image file (e.g. nifti volume or dicom slice)
+    Returns:
+        reader: sitk reader from which we can query the header information (e.g. reader.GetSpacing())
+    """
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(file_path)
+    reader.ReadImageInformation()
+
+    return reader
+
+
+def _count_dcm_files(dcm_dir: str) -> Tuple[int, Optional[str]]:
+    """This function counts the files of a dicom directory without opening them (hidden files and DICOMDIR are skipped)
+    Args:
+        dcm_dir: directory where dicom files are stored
+    Returns:
+        nb_files: number of candidate dicom files
+        first_file: path of the first file in name order (None if the directory is empty)
+    """
+    file_names = sorted(entry.name for entry in os.scandir(dcm_dir)
+                        if entry.is_file() and not entry.name.startswith(".") and entry.name.upper() != "DICOMDIR")
+    first_file = os.path.join(dcm_dir, file_names[0]) if file_names else None
+
+    return len(file_names), first_file
+
+
+def _get_dcm_slice_spacing(slice_reader: sitk.ImageFileReader) -> Optional[float]:
+    """This function reads the distance between slices from a dicom header: SpacingBetweenSlices if present,
+    otherwise SliceThickness (None if neither is available)"""
+    for tag in ("0018|0088", "0018|0050"):  # SpacingBetweenSlices, SliceThickness
+        if slice_reader.HasMetaDataKey(tag):
+            try:
+                return float(slice_reader.GetMetaData(tag).strip())
+            except ValueError:
+                continue
+    return None
+
+
+def get_dcm_series_header_info(dcm_dir: str,
+                               series_uid: Optional[str] = None,
+                               use_index: bool = False,
+                               index_path: Optional[str] = None,
+                               estimate: bool = False) -> dict:
+    """This function extracts the geometry of a dicom series without decoding the pixel data. The files of the series
+    are sorted along the slice normal from a few position tags (see _scan_dcm_series), or taken from the persistent
+    index if use_index is True (see index_dcm_series), and then only the headers of the first and last slices are read:
+    origin, size and direction are the same as the ones of a full read, and the slice spacing and slice direction are
+    derived from the positions of the first and last slices.
+    With estimate=True (and no index nor series_uid), only the header of one file is read and the number of slices is
+    the number of files in dcm_dir, so the cost does not depend on the number of slices. The result is approximate: it
+    assumes that dcm_dir only contains the dicom files of one series, with InstanceNumber increasing along the slice
+    normal (the origin is extrapolated from it), and the slice spacing comes from SpacingBetweenSlices (or SliceThickness)
+    Args:
+        dcm_dir: directory where dicom files are stored
+        series_uid: SeriesInstanceUID of the series of interest; if None (default), the first series found is used
+        use_index: if True, the series files are looked up in the persistent index (see index_dcm_series); defaults to False
+        index_path: path of the SQLite index; only used if use_index is True
+        estimate: if True, the geometry is estimated from one header (see above); defaults to False
+    Returns:
+        volume_info: it contains all the main volume information (same keys as get_sitk_volume_info)
+    Raises:
+        ValueError: if dcm_dir does not contain any dicom series, or if series_uid is not found in dcm_dir
+    """
+    if estimate and not use_index and series_uid is None:
+        nb_files, first_file = _count_dcm_files(dcm_dir)
+        if first_file is None:
+            raise FileNotFoundError("No dicom files found in {}".format(dcm_dir))
+        one_slice = read_image_information(first_file)
+        dims = one_slice.GetDimension()
+        size = list(one_slice.GetSize())
+        size[-1] = nb_files  # one slice per file
+        spacing = [float(value) for value in one_slice.GetSpacing()]
+        slice_spacing = _get_dcm_slice_spacing(one_slice)
+        if slice_spacing is not None:
+            spacing[-1] = slice_spacing
+        direction = np.asarray(one_slice.GetDirection(), dtype=np.float64).reshape(dims, dims)  # last column is the slice normal
+        origin = np.asarray(one_slice.GetOrigin(), dtype=np.float64)
+        if one_slice.HasMetaDataKey("0020|0013"):  # InstanceNumber: move back to the first slice
+            try:
+                origin = origin - (int(one_slice.GetMetaData("0020|0013").strip()) - 1) * spacing[-1] * direction[:, -1]
+            except ValueError:
+                pass
+        volume_info = {"dimensions": dims,
+                       "size": tuple(size),
+                       "origin": tuple(float(value) for value in origin),
+                       "spacing": tuple(spacing),
+                       "direction": tuple(direction.ravel().tolist()),
+                       "nb_components_per_pixel": one_slice.GetNumberOfComponents(),
+                       "pixel_type": one_slice.GetPixelID(),
+                       "pixel_id_type_as_string": sitk.GetPixelIDValueAsString(one_slice.GetPixelID()),
+                       "pixel_id_value": one_slice.GetPixelIDValue()
+                      }
+        return volume_info
+
+    series = index_dcm_series(dcm_dir, index_path=index_path) if use_index else _scan_dcm_series(dcm_dir)
+    dicom_names = _select_dcm_series(series, dcm_dir, series_uid)
+    first_slice = read_image_information(dicom_names[0])
+    dims = first_slice.GetDimension()
+    size = list(first_slice.GetSize())
+    spacing = [float(value) for value in first_slice.GetSpacing()]
+    direction = np.asarray(first_slice.GetDirection()).reshape(dims, dims)
+    size[-1] = len(dicom_names)  # one slice per file
+
+    if len(dicom_names) > 1:
+        last_slice = read_image_information(dicom_names[-1])
+        slice_vector = np.subtract(last_slice.GetOrigin(), first_slice.GetOrigin())  # type: np.ndarray
+        slice_vector_norm = np.linalg.norm(slice_vector)
+        if slice_vector_norm > 0:
+            spacing[-1] = float(slice_vector_norm / (len(dicom_names) - 1))
+            direction[:, -1] = slice_vector / slice_vector_norm
+
+    volume_info = {"dimensions": dims,
+                   "size": tuple(size),
+                   "origin": first_slice.GetOrigin(),
+                   "spacing": tuple(spacing),
+                   "direction": tuple(direction.ravel().tolist()),
+                   "nb_components_per_pixel": first_slice.GetNumberOfComponents(),
+                   "pixel_type": first_slice.GetPixelID(),
+                   "pixel_id_type_as_string": sitk.GetPixelIDValueAsString(first_slice.GetPixelID()),
+                   "pixel_id_value": first_slice.GetPixelIDValue()
+                  }
+
+    return volume_info
+
+
 def get_sitk_volume_info(path_to_nii_or_dcm: str,
-                         print_info: bool = False) -> dict:
+                         print_info: bool = False,
+                         header_only: bool = False,
+                         use_index: bool = False,
+                         estimate: bool = False) -> dict:
     """This function prints basic info of the input volume
     Args:
         path_to_nii_or_dcm: path to volume that we want to explore
         print_info: whether to print the volume info or no; defaults to False
+        header_only: if True, only the metadata is read and the pixel data is never decoded, which is much faster;
+            for dicom directories, see get_dcm_series_header_info for how the geometry is obtained. Defaults to False
+        use_index: if True, dicom directories are looked up in the persistent series index (see index_dcm_series); defaults to False
+        estimate: only used for dicom directories with header_only; if True, the geometry is estimated from the header
+            of one file, which is faster but approximate (see get_dcm_series_header_info). Defaults to False
     Returns:
         volume_info: it contains all the main volume information
     """
-    if os.path.isdir(path_to_nii_or_dcm):  # if path_to_nii_or_dcm is a directory
-        volume_sitk = read_dcm_series(path_to_nii_or_dcm)
-    else:  # if instead path_to_nii_or_dcm is a file
-        volume_sitk = sitk.ReadImage(path_to_nii_or_dcm)  # read as sitk Image
-    
-    volume_info = {"dimensions": volume_sitk.GetDimension(),
-                   "size": volume_sitk.GetSize(),
-                   "origin": volume_sitk.GetOrigin(),
-                   "spacing": volume_sitk.GetSpacing(),
-                   "direction": volume_sitk.GetDirection(),
-                   "nb_components_per_pixel": volume_sitk.GetNumberOfComponentsPerPixel(),
-                   "pixel_type": volume_sitk.GetPixelID(),
-                   "pixel_id_type_as_string": volume_sitk.GetPixelIDTypeAsString(),
-                   "pixel_id_value": volume_sitk.GetPixelIDValue()
-                  }
+    if header_only:
+        if os.path.isdir(path_to_nii_or_dcm):  # if path_to_nii_or_dcm is a directory
+            volume_info = get_dcm_series_header_info(path_to_nii_or_dcm, use_index=use_index, estimate=estimate)
+        else:  # if instead path_to_nii_or_dcm is a file
+            reader = read_image_information(path_to_nii_or_dcm)
+            volume_info = {"dimensions": reader.GetDimension(),
+                           "size": reader.GetSize(),
+                           "origin": reader.GetOrigin(),
+                           "spacing": tuple(float(value) for value in reader.GetSpacing()),
+                           "direction": reader.GetDirection(),
+                           "nb_components_per_pixel": reader.GetNumberOfComponents(),
+                           "pixel_type": reader.GetPixelID(),
+                           "pixel_id_type_as_string": sitk.GetPixelIDValueAsString(reader.GetPixelID()),
+                           "pixel_id_value": reader.GetPixelIDValue()
+                          }
+    else:
+        if os.path.isdir(path_to_nii_or_dcm):  # if path_to_nii_or_dcm is a directory
+            volume_sitk = read_dcm_series(path_to_nii_or_dcm, use_index=use_index)
+        else:  # if instead path_to_nii_or_dcm is a file
+            volume_sitk = sitk.ReadImage(path_to_nii_or_dcm)  # read as sitk Image
+
+        volume_info = {"dimensions": volume_sitk.GetDimension(),
+                       "size": volume_sitk.GetSize(),
+                       "origin": volume_sitk.GetOrigin(),
+                       "spacing": volume_sitk.GetSpacing(),
+                       "direction": volume_sitk.GetDirection(),
+                       "nb_components_per_pixel": volume_sitk.GetNumberOfComponentsPerPixel(),
+                       "pixel_type": volume_sitk.GetPixelID(),
+                       "pixel_id_type_as_string": volume_sitk.GetPixelIDTypeAsString(),
+                       "pixel_id_value": volume_sitk.GetPixelIDValue()
+                      }
     
     if print_info:
-        print("Dimensions: {}".format(volume_sitk.GetDimension()))
-        print("Size: {}".format(volume_sitk.GetSize()))
-        print("Origin: {}".format(volume_sitk.GetOrigin()))
-        print("Spacing: {}".format(volume_sitk.GetSpacing()))
-        print("Direction cosine matrix: {}".format(volume_sitk.GetDirection()))
-        print("Nb. components per pixel {}".format(volume_sitk.GetNumberOfComponentsPerPixel()))
-        print("Pixel type: {}".format(volume_sitk.GetPixelID()))
-        print("Pixel ID type as string: {}".format(volume_sitk.GetPixelIDTypeAsString()))
-        print("Pixel ID value: {}".format(volume_sitk.GetPixelIDValue()))
+        print("Dimensions: {}".format(volume_info["dimensions"]))
+        print("Size: {}".format(volume_info["size"]))
+        print("Origin: {}".format(volume_info["origin"]))
+        print("Spacing: {}".format(volume_info["spacing"]))
+        print("Direction cosine matrix: {}".format(volume_info["direction"]))
+        print("Nb. components per pixel {}".format(volume_info["nb_components_per_pixel"]))
+        print("Pixel type: {}".format(volume_info["pixel_type"]))
+        print("Pixel ID type as string: {}".format(volume_info["pixel_id_type_as_string"]))
+        print("Pixel ID value: {}".format(volume_info["pixel_id_value"]))
     
     return volume_info
    
@@ -171,7 +820,8 @@ def change_dcm_tags_one_derived_image(ds: pydicom.dataset.FileDataset,
                                       series_time: str,
                                       new_series_name: str,
                                       new_protocol_name: str,
-                                      original_study_instance_uid: pydicom.uid.UID) -> pydicom.dataset.FileDataset:
+                                      original_study_instance_uid: pydicom.uid.UID,
+                                      instance_time: Optional[str] = None) -> pydicom.dataset.FileDataset:
     """This function changes some dicom tags for the derived volume (following https://gdcm.sourceforge.net/wiki/index.php/Writing_DICOM but not only).
     Args:
         ds: pydicom object that contains the dicom tags
@@ -182,9 +832,14 @@ def change_dcm_tags_one_derived_image(ds: pydicom.dataset.FileDataset,
         new_series_name: name of new generated series
         new_protocol_name: name of new generated protocol
         original_study_instance_uid: study instance uid of original dicom volume
+        instance_time: time of this dcm image (HHMMSS.ffffff), used for the instance creation, acquisition and content
+            times; it must be different for each dcm image of the series. If None (default), the current time is used
     Returns:
         ds: same pydicom object, but with some modified tags
     """
+    if instance_time is None:
+        instance_time = datetime.today().strftime('%H%M%S.%f')  # save time now
+
     # below, we report all the dcm tags that will be changed
     
     # 1) Media Storage SOP Instance UID (0002, 0003), it's a tag in the file meta information
@@ -199,8 +854,7 @@ def change_dcm_tags_one_derived_image(ds: pydicom.dataset.FileDataset,
     
     # 4) Instance creation time (0008, 0013)
     if "InstanceCreationTime" in ds:
-        time_now = datetime.today().strftime('%H%M%S.%f')  # save time now
-        ds.InstanceCreationTime = time_now
+        ds.InstanceCreationTime = instance_time
     
     # 5) SOP Instance UID (0008, 0018)
     if "SOPInstanceUID" in ds:
@@ -213,13 +867,11 @@ def change_dcm_tags_one_derived_image(ds: pydicom.dataset.FileDataset,
     
     # 7) Acquisition Time (0008, 0032); generate a unique time for each dcm image
     if "AcquisitionTime" in ds:
-        time_now = datetime.today().strftime('%H%M%S.%f')  # save time now
-        ds.AcquisitionTime = time_now
+        ds.AcquisitionTime = instance_time
     
     # 8) Content Time (0008, 0033); this needs to be different for each dcm image
     if "ContentTime" in ds:
-        time_now = datetime.today().strftime('%H%M%S.%f')  # save time now
-        ds.ContentTime = time_now
+        ds.ContentTime = instance_time
     
     # 9) Manufacturer (0008, 0070)
     if "Manufacturer" in ds:
@@ -265,3 +917,110 @@ def change_dcm_tags_one_derived_image(ds: pydicom.dataset.FileDataset,
     # 21) Pixel Data (7FE0, 0010) was already modified in MeVisLab
     
     return ds    
+
+
+def _change_dcm_tags_one_derived_file(paths_and_time: Tuple[str, str, str],
+                                      series_date: str,
+                                      invented_manufacturer: str,
+                                      invented_model_name: str,
+                                      series_time: str,
+                                      new_series_name: str,
+                                      new_protocol_name: str,
+                                      original_study_instance_uid: pydicom.uid.UID) -> str:
+    """This function reads one dcm file of a derived series, changes its tags and writes it to disk
+    Args:
+        paths_and_time: input dcm path, output dcm path and instance time of this dcm image
+        series_date: date of the series (YYYYMMDD)
+        invented_manufacturer: invented manufacturer name
+        invented_model_name: invented model name
+        series_time: time of the series (HHMMSS.ffffff)
+        new_series_name: name of new generated series
+        new_protocol_name: name of new generated protocol
+        original_study_instance_uid: study instance uid of original dicom volume
+    Returns:
+        out_path: path of the written dcm file
+    """
+    in_path, out_path, instance_time = paths_and_time
+    # large elements (e.g. the pixel data) are not loaded here: they are read from in_path only when the file is written
+    ds = pydicom.dcmread(in_path, defer_size="1 KB")
+    ds = change_dcm_tags_one_derived_image(ds, series_date, invented_manufacturer, invented_model_name, series_time,
+                                           new_series_name, new_protocol_name, original_study_instance_uid,
+                                           instance_time=instance_time)
+    ds.save_as(out_path)
+
+    return out_path
+
+
+def change_dcm_tags_derived_series(in_dcm_dir: str,
+                                   out_dcm_dir: str,
+                                   invented_manufacturer: str,
+                                   invented_model_name: str,
+                                   new_series_name: str,
+                                   new_protocol_name: str,
+                                   original_study_instance_uid: pydicom.uid.UID,
+                                   series_date: Optional[str] = None,
+                                   series_time: Optional[str] = None,
+                                   workers: Optional[int] = None,
+                                   backend: str = "process") -> List[str]:
+    """This function applies change_dcm_tags_one_derived_image to all the dcm files of a derived series and writes them in parallel.
+    The values shared by the series are computed once, and each dcm image gets a unique instance time; these times
+    increase monotonically with the InstanceNumber of the dcm images
+    Args:
+        in_dcm_dir: directory containing the dcm files of the derived series
+        out_dcm_dir: directory where the modified dcm files are saved (with the same filenames); will be created if not present
+        invented_manufacturer: invented manufacturer name
+        invented_model_name: invented model name
+        new_series_name: name of new generated series
+        new_protocol_name: name of new generated protocol
+        original_study_instance_uid: study instance uid of original dicom volume
+        series_date: date of the series (YYYYMMDD); defaults to today's date
+        series_time: time of the series (HHMMSS.ffffff); defaults to the current time
+        workers: number of parallel workers; defaults to the number of cpus
+        backend: either "process" (one process per worker) or "thread" (one thread per worker); defaults to "process"
+    Returns:
+        out_paths: paths of the written dcm files, sorted by InstanceNumber
+    Raises:
+        ValueError: if backend is neither "process" nor "thread"
+    """
+    if backend not in ("process", "thread"):
+        raise ValueError("backend can only be 'process' or 'thread'. Got {} instead".format(backend))
+    if not os.path.exists(out_dcm_dir):  # if output folder does not exist
+        os.makedirs(out_dcm_dir)  # create it
+
+    # sort the dcm images by InstanceNumber; only this tag is read, and the pixel data is never loaded
+    in_paths = [entry.path for entry in os.scandir(in_dcm_dir) if entry.is_file()]
+    instance_numbers = {}  # type: Dict[str, int]
+    for in_path in in_paths:
+        ds_header = pydicom.dcmread(in_path, stop_before_pixels=True, specific_tags=["InstanceNumber"])
+        instance_numbers[in_path] = int(ds_header.get("InstanceNumber", 0) or 0)
+    in_paths.sort(key=lambda path: (instance_numbers[path], path))
+
+    # values shared by the whole series
+    time_now = datetime.today()
+    if series_date is None:
+        series_date = time_now.strftime('%Y%m%d')
+    if series_time is None:
+        series_time = time_now.strftime('%H%M%S.%f')
+
+    # one unique time per dcm image (1 microsecond apart); start early enough not to wrap around midnight
+    end_of_day = datetime.combine(time_now.date(), datetime.max.time())
+    first_instance_time = min(time_now, end_of_day - timedelta(microseconds=len(in_paths)))
+    paths_and_times = [(in_path,
+                        os.path.join(out_dcm_dir, os.path.basename(in_path)),
+                        (first_instance_time + timedelta(microseconds=idx)).strftime('%H%M%S.%f'))
+                       for idx, in_path in enumerate(in_paths)]
+
+    worker_fn = functools.partial(_change_dcm_tags_one_derived_file,
+                                  series_date=series_date,
+                                  invented_manufacturer=invented_manufacturer,
+                                  invented_model_name=invented_model_name,
+                                  series_time=series_time,
+                                  new_series_name=new_series_name,
+                                  new_protocol_name=new_protocol_name,
+                                  original_study_instance_uid=original_study_instance_uid)
+    workers = workers or os.cpu_count() or 1
+    executor_class = ProcessPoolExecutor if backend == "process" else ThreadPoolExecutor
+    with executor_class(max_workers=workers) as executor:
+        out_paths = list(iter_executor_results(executor, worker_fn, paths_and_times, max_in_flight=4 * workers))
+
+    return out_paths
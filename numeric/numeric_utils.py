@@ -1,25 +1,127 @@
-import math
 import time
+import numpy as np
+from typing import Optional, Union
+
+
+ROUNDING_MODES = ("half_up", "half_even", "half_away")
+
+
+def _snap_to_halves(scaled: np.ndarray, max_ulps: int):
+    """This function moves (in place) the values that are within max_ulps ulps of a tie (x.5) exactly onto the tie.
+    This undoes the binary representation error of decimal inputs: e.g. 2.675 is stored as 2.67499999999999982236431605997495353221893310546875,
+    so 2.675 * 100 = 267.49999999999997 and would be rounded down, although the decimal number 2.675 is a tie
+    Args:
+        scaled (np.ndarray): float array (already multiplied by 10**decimals), modified in place
+        max_ulps (int): maximum distance (in units in the last place) from a tie for a value to be snapped
+    """
+    nearest_halves = np.floor(scaled) + 0.5
+    close_to_half = np.abs(scaled - nearest_halves) <= max_ulps * np.spacing(np.abs(nearest_halves))
+    np.copyto(scaled, nearest_halves, where=close_to_half)
+
+
+def _round_scaled(scaled: np.ndarray, mode: str):
+    """This function rounds (in place) a float array to integers with the given tie-breaking mode
+    Args:
+        scaled (np.ndarray): float array, modified in place
+        mode (str): one of ROUNDING_MODES
+    """
+    if mode == "half_even":
+        np.rint(scaled, out=scaled)  # IEEE default rounding: ties go to the even integer
+    elif mode == "half_up":
+        floor = np.floor(scaled)
+        np.add(floor, (scaled - floor) >= 0.5, out=scaled)  # scaled - floor is exact, unlike scaled + 0.5
+    elif mode == "half_away":
+        negative = np.signbit(scaled)
+        np.abs(scaled, out=scaled)
+        floor = np.floor(scaled)
+        np.add(floor, (scaled - floor) >= 0.5, out=scaled)
+        np.negative(scaled, out=scaled, where=negative)
+    else:
+        raise ValueError("mode must be one of {}; got {}".format(ROUNDING_MODES, mode))
+
+
+def round_array(values: Union[float, list, np.ndarray, "pd.Series", "pd.DataFrame"],
+                decimals: int = 0,
+                mode: str = "half_up",
+                exact: bool = False,
+                out: Optional[np.ndarray] = None,
+                max_ulps: int = 1) -> Union[float, np.ndarray, "pd.Series", "pd.DataFrame"]:
+    """This function rounds all the values of a numpy array (or list, scalar, pandas Series/DataFrame) at once
+    Args:
+        values (float, list, np.ndarray, pd.Series or pd.DataFrame): values to round
+        decimals (int): number of decimal figures that we want to keep (can be negative, e.g. -1 rounds to tens); defaults to zero
+        mode (str): how ties are broken: "half_up" (towards +inf, e.g. -1.5 becomes -1.0), "half_even" (to the even
+                    neighbour, like np.round), "half_away" (away from zero, e.g. -1.5 becomes -2.0); defaults to "half_up"
+        exact (bool): if True, values that are within max_ulps ulps of a tie are treated as ties, so that rounding matches
+                      the decimal number that was typed (e.g. 2.675 becomes 2.68 with decimals=2); defaults to False
+        out (np.ndarray): optional float array where the result is written (can be the input array itself, to round
+                          in place); it must have the same shape as values and a floating dtype
+        max_ulps (int): tolerance used by exact; defaults to 1, which is enough to recover decimal ties
+    Returns:
+        rounded_values (float, np.ndarray, pd.Series or pd.DataFrame): rounded values; same type as the input
+                       (out itself if it was given and the input is not a pandas object)
+    Raises:
+        ValueError: if mode is unknown, or if out is not a float array with the same shape as values
+    Example:
+        >>> round_array(np.array([2.675, -1.5, 0.5]), decimals=2, exact=True)
+        array([ 2.68, -1.5 ,  0.5 ])
+        >>> round_array(np.array([-1.5, 0.5, 2.5]), mode="half_away")
+        array([-2.,  1.,  3.])
+    """
+    if hasattr(values, "to_numpy") and hasattr(values, "index"):  # pandas Series or DataFrame (pandas is not a hard dependency)
+        rounded_array = round_array(values.to_numpy(dtype=np.float64), decimals, mode, exact, out, max_ulps)
+        rounded_values = values.copy()
+        rounded_values.loc[:] = rounded_array
+        return rounded_values
+
+    is_scalar = np.ndim(values) == 0
+    values = np.asarray(values)
+    if not np.issubdtype(values.dtype, np.floating):
+        values = values.astype(np.float64)
+    if out is None:
+        out = np.empty_like(values)
+    elif not isinstance(out, np.ndarray) or out.dtype.kind != "f":
+        raise ValueError("out must be a float numpy array; got {}".format(getattr(out, "dtype", type(out))))
+    elif out.shape != values.shape:
+        raise ValueError("out must have shape {}; got {}".format(values.shape, out.shape))
+
+    multiplier = 10.0 ** abs(decimals)
+    if decimals >= 0:
+        np.multiply(values, multiplier, out=out)
+    else:
+        np.divide(values, multiplier, out=out)
+    with np.errstate(invalid="ignore"):  # inf - inf in the kernels; infs and nans are left unchanged anyway
+        if exact:
+            _snap_to_halves(out, max_ulps)
+        _round_scaled(out, mode)
+    if decimals >= 0:
+        np.divide(out, multiplier, out=out)
+    else:
+        np.multiply(out, multiplier, out=out)
+
+    rounded_values = float(out) if is_scalar else out
+
+    return rounded_values
 
 
 def round_half_up(n: float, decimals: float = 0) -> float:
     """This function rounds to the nearest integer number (e.g 2.4 becomes 2.0 and 2.6 becomes 3);
-     in case of tie, it rounds up (e.g. 1.5 becomes 2.0 and not 1.0)
+     in case of tie, it rounds up (e.g. 1.5 becomes 2.0 and not 1.0). Ties are detected on the decimal value,
+     so e.g. 2.675 becomes 2.68 with decimals=2. To round whole arrays, use round_array
     Args:
         n (float): number to round
         decimals (int): number of decimal figures that we want to keep; defaults to zero
     Returns:
         rounded_number (float): input number rounded with the desired decimals
     """
-    multiplier = 10 ** decimals
-    
-    rounded_number = math.floor(n*multiplier + 0.5) / multiplier
+    rounded_number = round_array(n, int(decimals), mode="half_up", exact=True)
     
     return rounded_number
 
 
 def print_running_time(start_time: float, end_time: float, process_name: str):
-    """This function takes as input the start and the end time of a process and prints to console the time elapsed for this process
+    """This function takes as input the start and the end time of a process and prints to console the time elapsed for this process.
+    For structured timing of several (nested) stages, see SpanProfiler in timing_utils.py
     Args:
         start_time (float): instant when the timer was started
         end_time (float): instant when the timer was stopped
@@ -33,4 +135,4 @@ def print_running_time(start_time: float, end_time: float, process_name: str):
     temp = temp - 3600 * hours  # if hours is not zero, remove equivalent amount of seconds
     minutes = temp // 60  # compute minutes
     seconds = temp - 60 * minutes  # compute minutes
-    print('\n%s time: %d hh %d mm %d ss' % (sentence, hours, minutes, seconds))
+    print('\n%s time: %d hh %d mm %.3f ss' % (sentence, hours, minutes, seconds))  # keep the sub-second part
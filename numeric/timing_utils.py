@@ -0,0 +1,232 @@
+import os
+import csv
+import json
+import time
+import functools
+import threading
+import contextlib
+import tracemalloc
+from collections import defaultdict
+from typing import Callable, Dict, Iterator, List, Optional, Any
+
+
+def _percentile(sorted_values: List[int], q: float) -> int:
+    """This function returns the q-th percentile (nearest-rank method) of an already sorted, non-empty list
+    Args:
+        sorted_values (list): values sorted in ascending order
+        q (float): percentile to compute, in [0, 100]
+    Returns:
+        value: q-th percentile of sorted_values
+    """
+    rank = max(0, -(-len(sorted_values) * q // 100) - 1)  # ceil(n*q/100) - 1
+
+    return sorted_values[int(rank)]
+
+
+class SpanProfiler:
+    """This class measures the running time (and optionally the peak memory) of named, possibly nested, code spans
+    (e.g. the stages of a pipeline: resampling, cropping, DICOM rewriting) and aggregates them per span.
+    Times are measured with time.perf_counter_ns; nested spans are identified by their path (e.g. "pipeline/resampling").
+    Each thread has its own span stack, so spans can be opened from several threads; memory tracing, instead, relies
+    on the (process-wide) tracemalloc, so its numbers are only reliable for single-threaded code
+    Args:
+        trace_memory (bool): if True, record the peak memory allocated (by Python) during each span with tracemalloc;
+                             tracing slows the code down, so it defaults to False
+    Example:
+        >>> profiler = SpanProfiler()
+        >>> with profiler.span("pipeline"):
+        ...     with profiler.span("resampling"):
+        ...         resample_volume(...)
+        >>> profiler.print_summary()
+        >>> profiler.export_chrome_trace("trace.json")  # open it in chrome://tracing or https://ui.perfetto.dev
+    """
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.records = []  # type: List[Dict[str, Any]]
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin_ns = time.perf_counter_ns()
+        self._started_tracemalloc = False
+
+    def _get_stack(self) -> list:
+        """This method returns the stack of open spans of the current thread"""
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextlib.contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """This method is a context manager that times the code in its body as a span called name
+        Args:
+            name (str): name of the span; if it's opened inside another span, its path will be "parent_path/name"
+        """
+        stack = self._get_stack()
+        path = "{}/{}".format(stack[-1]["path"], name) if stack else name
+        frame = {"path": path, "start_memory": 0, "peak_memory": 0}
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            current_memory, peak_memory = tracemalloc.get_traced_memory()
+            if stack:  # fold the peak reached so far into the parent span, since we are about to reset it
+                stack[-1]["peak_memory"] = max(stack[-1]["peak_memory"], peak_memory)
+            tracemalloc.reset_peak()
+            frame["start_memory"] = frame["peak_memory"] = current_memory
+        stack.append(frame)
+        start_ns = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            duration_ns = time.perf_counter_ns() - start_ns
+            stack.pop()
+            record = {"name": name,
+                      "path": path,
+                      "depth": len(stack),
+                      "start_ns": start_ns - self._origin_ns,
+                      "duration_ns": duration_ns,
+                      "thread_id": threading.get_ident()}
+            if self.trace_memory:
+                frame["peak_memory"] = max(frame["peak_memory"], tracemalloc.get_traced_memory()[1])
+                record["peak_memory_bytes"] = frame["peak_memory"] - frame["start_memory"]
+                if stack:  # the peak of a child span is also a peak of its parent
+                    stack[-1]["peak_memory"] = max(stack[-1]["peak_memory"], frame["peak_memory"])
+                elif self._started_tracemalloc:
+                    tracemalloc.stop()
+                    self._started_tracemalloc = False
+            with self._lock:
+                self.records.append(record)
+
+    def timed(self, name: Optional[str] = None) -> Callable:
+        """This method is a decorator that times every call of the decorated function as a span
+        Args:
+            name (str): name of the span; defaults to the qualified name of the decorated function
+        Example:
+            >>> @profiler.timed()
+            ... def crop(volume): ...
+        """
+        def decorator(fn: Callable) -> Callable:
+            span_name = name if name is not None else fn.__qualname__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        """This method removes all the recorded spans"""
+        with self._lock:
+            self.records = []
+            self._origin_ns = time.perf_counter_ns()
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """This method aggregates the recorded spans by path
+        Returns:
+            span_stats (dict): for each span path (in order of first appearance), a dict with count, total_s, mean_s,
+                               p50_s, p95_s, max_s and, if memory is traced, max_peak_memory_bytes
+        """
+        durations_per_path = defaultdict(list)  # type: Dict[str, List[int]]
+        peak_memory_per_path = defaultdict(int)  # type: Dict[str, int]
+        with self._lock:
+            records = sorted(self.records, key=lambda rec: rec["start_ns"])
+        for record in records:
+            durations_per_path[record["path"]].append(record["duration_ns"])
+            if "peak_memory_bytes" in record:
+                peak_memory_per_path[record["path"]] = max(peak_memory_per_path[record["path"]], record["peak_memory_bytes"])
+        span_stats = {}
+        for path, durations in durations_per_path.items():
+            durations.sort()
+            span_stats[path] = {"count": len(durations),
+                                "total_s": sum(durations) / 1e9,
+                                "mean_s": sum(durations) / len(durations) / 1e9,
+                                "p50_s": _percentile(durations, 50) / 1e9,
+                                "p95_s": _percentile(durations, 95) / 1e9,
+                                "max_s": durations[-1] / 1e9}
+            if path in peak_memory_per_path:
+                span_stats[path]["max_peak_memory_bytes"] = peak_memory_per_path[path]
+
+        return span_stats
+
+    def print_summary(self):
+        """This method prints the per-span aggregates as a table, sorted by total time"""
+        span_stats = self.summary()
+        print("\n{:<50} {:>8} {:>12} {:>12} {:>12} {:>12}".format("span", "count", "total (s)", "p50 (s)", "p95 (s)", "max (s)"))
+        for path, stats in sorted(span_stats.items(), key=lambda item: item[1]["total_s"], reverse=True):
+            print("{:<50} {:>8d} {:>12.6f} {:>12.6f} {:>12.6f} {:>12.6f}".format(path, stats["count"], stats["total_s"],
+                                                                                    stats["p50_s"], stats["p95_s"], stats["max_s"]))
+
+    def export_json(self, out_path: str, include_records: bool = True):
+        """This method saves the per-span aggregates (and optionally every recorded span) to a json file
+        Args:
+            out_path (str): path of the output json file
+            include_records (bool): if True, also save the individual spans; defaults to True
+        """
+        content = {"summary": self.summary()}
+        if include_records:
+            with self._lock:
+                content["records"] = list(self.records)
+        with open(out_path, "w") as out_file:
+            json.dump(content, out_file, indent=2)
+
+    def export_csv(self, out_path: str):
+        """This method saves the per-span aggregates to a csv file (one row per span path)
+        Args:
+            out_path (str): path of the output csv file
+        """
+        span_stats = self.summary()
+        columns = ["count", "total_s", "mean_s", "p50_s", "p95_s", "max_s"]
+        if any("max_peak_memory_bytes" in stats for stats in span_stats.values()):
+            columns.append("max_peak_memory_bytes")
+        with open(out_path, "w", newline="") as out_file:
+            writer = csv.writer(out_file)
+            writer.writerow(["path"] + columns)
+            for path, stats in span_stats.items():
+                writer.writerow([path] + [stats.get(column, "") for column in columns])
+
+    def export_chrome_trace(self, out_path: str):
+        """This method saves the recorded spans in the Chrome trace event format, which can be opened with
+        chrome://tracing or https://ui.perfetto.dev to see the spans on a timeline
+        Args:
+            out_path (str): path of the output json file
+        """
+        with self._lock:
+            records = list(self.records)
+        pid = os.getpid()
+        trace_events = []
+        for record in records:
+            event = {"name": record["name"],
+                     "cat": record["path"],
+                     "ph": "X",  # complete event (start + duration)
+                     "ts": record["start_ns"] / 1e3,  # microseconds
+                     "dur": record["duration_ns"] / 1e3,
+                     "pid": pid,
+                     "tid": record["thread_id"]}
+            if "peak_memory_bytes" in record:
+                event["args"] = {"peak_memory_bytes": record["peak_memory_bytes"]}
+            trace_events.append(event)
+        with open(out_path, "w") as out_file:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, out_file)
+
+
+DEFAULT_PROFILER = SpanProfiler()
+
+
+def span(name: str) -> contextlib.AbstractContextManager:
+    """This function times the body of a with statement as a span of DEFAULT_PROFILER
+    Args:
+        name (str): name of the span
+    Example:
+        >>> with span("cropping"):
+        ...     crop_volume_to_nonzero_bbox(volume)
+        >>> DEFAULT_PROFILER.print_summary()
+    """
+    return DEFAULT_PROFILER.span(name)
+
+
+def timed(name: Optional[str] = None) -> Callable:
+    """This function is a decorator that times every call of the decorated function as a span of DEFAULT_PROFILER
+    Args:
+        name (str): name of the span; defaults to the qualified name of the decorated function
+    """
+    return DEFAULT_PROFILER.timed(name)
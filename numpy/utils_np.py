@@ -1,22 +1,269 @@
 import numpy as np
-from typing import Any
+from typing import Any, Dict, Iterator, Sequence, Tuple, Union
 
+# checks that can be requested to validate_array
+ARRAY_CHECKS = ("has_nans", "has_infs", "is_binary", "all_in_range")
+# maximum number of bins for which integer values are counted with np.bincount instead of sorting
+MAX_BINCOUNT_BINS = 2 ** 24
 
-def find_most_frequent_value(input_array: np.ndarray) -> Any:
-    """This function finds the most common value in the input numpy array
+
+def _merge_value_counts(values_list: list, counts_list: list) -> Tuple[np.ndarray, np.ndarray]:
+    """This function merges several (values, counts) pairs into a single pair with unique sorted values
+    Args:
+        values_list (list): list of arrays of values
+        counts_list (list): list of arrays with the counts of the corresponding values
+    Returns:
+        values (np.ndarray): unique values, sorted in ascending order
+        counts (np.ndarray): total count of each value
+    """
+    values, inverse = np.unique(np.concatenate(values_list), return_inverse=True)
+    counts = np.bincount(inverse.ravel(), weights=np.concatenate(counts_list), minlength=values.size).astype(np.int64)
+
+    return values, counts
+
+
+def _count_values(input_array: Any, chunk_size: int = 2 ** 20) -> Tuple[np.ndarray, np.ndarray]:
+    """This function counts the occurrences of every distinct value of the input array, one chunk at a time. Integer
+    arrays with a small range of values are counted with np.bincount (no sorting); all other arrays are counted with
+    np.unique on each chunk, and the partial counts are merged as the scan goes on
+    Args:
+        input_array (np.ndarray): input array
+        chunk_size (int): number of elements processed at once; defaults to 2**20
+    Returns:
+        values (np.ndarray): distinct values, sorted in ascending order
+        counts (np.ndarray): number of occurrences of each value
+    """
+    dtype = input_array.dtype
+    if np.issubdtype(dtype, np.integer) or np.issubdtype(dtype, np.bool_):
+        chunks_min_max = [(chunk.min(), chunk.max()) for chunk in _iter_array_chunks(input_array, chunk_size) if chunk.size > 0]
+        if chunks_min_max:
+            min_value = min(chunk_min for chunk_min, _ in chunks_min_max)
+            max_value = max(chunk_max for _, chunk_max in chunks_min_max)
+            nb_bins = int(max_value) - int(min_value) + 1
+            if nb_bins <= MAX_BINCOUNT_BINS:
+                offset = np.asarray(min_value).astype(np.int64)  # shift the values so that the smallest one falls in bin 0
+                counts = np.zeros(nb_bins, dtype=np.int64)
+                no_shift_needed = offset == 0 and np.can_cast(dtype, np.intp)  # then bincount can read the values directly
+                for chunk in _iter_array_chunks(input_array, chunk_size):
+                    chunk_bins = chunk.ravel() if no_shift_needed else (chunk.astype(np.int64) - offset).ravel()
+                    counts += np.bincount(chunk_bins, minlength=nb_bins)
+                idxs_nonzero_counts = np.flatnonzero(counts)
+                values = (idxs_nonzero_counts + offset).astype(dtype)
+
+                return values, counts[idxs_nonzero_counts]
+
+    values_list, counts_list = [], []  # partial counts that still have to be merged
+    merged_size = nb_pending_values = 0
+    for chunk in _iter_array_chunks(input_array, chunk_size):
+        chunk_values, chunk_counts = np.unique(chunk, return_counts=True)
+        values_list.append(chunk_values)
+        counts_list.append(chunk_counts)
+        nb_pending_values += chunk_values.size
+        if nb_pending_values > max(chunk_size, merged_size):  # merge only when the pending counts outgrow the merged ones (amortized n log n)
+            merged_values, merged_counts = _merge_value_counts(values_list, counts_list)
+            values_list, counts_list = [merged_values], [merged_counts]
+            merged_size = nb_pending_values = merged_values.size
+    if not values_list:
+        return np.array([], dtype=dtype), np.array([], dtype=np.int64)
+    values, counts = _merge_value_counts(values_list, counts_list)
+
+    return values, counts
+
+
+def _most_frequent_values_along_rows(rows: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """This function finds the top_k most frequent values of each row of a 2D array
+    Args:
+        rows (np.ndarray): 2D array; the most frequent values are computed independently for each row
+        top_k (int): number of most frequent values to return for each row
+    Returns:
+        values (np.ndarray): array of shape (nb_rows, top_k) with the most frequent values of each row, sorted by decreasing count
+        counts (np.ndarray): array of shape (nb_rows, top_k) with the corresponding counts; 0 for padding entries
+            (i.e. when a row has less than top_k distinct values)
+    """
+    nb_rows, row_len = rows.shape
+    is_integer = np.issubdtype(rows.dtype, np.integer) or np.issubdtype(rows.dtype, np.bool_)
+    if is_integer and rows.size > 0:
+        offset = np.asarray(rows.min()).astype(np.int64)
+        nb_bins = int(rows.max()) - int(rows.min()) + 1
+        if nb_rows * nb_bins <= MAX_BINCOUNT_BINS:  # one bincount for all rows: each row gets its own range of bins
+            flat_bins = (rows.astype(np.int64) - offset) + np.arange(nb_rows, dtype=np.int64)[:, None] * nb_bins
+            counts = np.bincount(flat_bins.ravel(), minlength=nb_rows * nb_bins).reshape(nb_rows, nb_bins)
+            if top_k == 1:  # argmax is faster than sorting
+                idxs_top = np.argmax(counts, axis=1)[:, None]
+            else:
+                idxs_top = np.argsort(-counts, axis=1, kind="stable")[:, :top_k]  # stable: ties go to the smallest value
+            values = (idxs_top + offset).astype(rows.dtype)
+            top_counts = np.take_along_axis(counts, idxs_top, axis=1)
+            if idxs_top.shape[1] < top_k:  # less bins than top_k
+                values = np.pad(values, ((0, 0), (0, top_k - idxs_top.shape[1])))
+                top_counts = np.pad(top_counts, ((0, 0), (0, top_k - idxs_top.shape[1])))
+
+            return values, top_counts
+
+    values = np.zeros((nb_rows, top_k), dtype=rows.dtype)
+    top_counts = np.zeros((nb_rows, top_k), dtype=np.int64)
+    for row_idx in range(nb_rows):
+        row_values, row_counts = _count_values(rows[row_idx])
+        idxs_top = np.argsort(-row_counts, kind="stable")[:top_k]
+        values[row_idx, :idxs_top.size] = row_values[idxs_top]
+        top_counts[row_idx, :idxs_top.size] = row_counts[idxs_top]
+
+    return values, top_counts
+
+
+def find_most_frequent_value(input_array: np.ndarray,
+                             top_k: int = None,
+                             axis: Union[int, Tuple[int, ...]] = None) -> Any:
+    """This function finds the most common value in the input numpy array. Integer arrays with a small range of
+    values are counted with np.bincount (no sorting); all other arrays are counted chunk by chunk. In case of ties,
+    the smallest value wins.
     Args:
         input_array (np.ndarray): input array for which we want to find the most frequent value
+        top_k (int): if specified, the top_k most frequent values are returned together with their counts
+        axis (int or tuple): if specified, the most frequent values are computed along these axes (which are
+            reduced, like in np.sum); e.g. axis=(0, 1) gives the mode of each axial slice of a 3D volume
     Returns:
-        most_frequent_value (*): most frequent value
+        most_frequent_value (*): most frequent value; if axis is specified, an array with the shape of the non-reduced axes.
+            If top_k is specified, a tuple (values, counts) with the top_k most frequent values sorted by decreasing
+            count; if axis is also specified, both arrays have shape (*non-reduced axes, top_k), and entries with count 0 are padding
+    Raises:
+        ValueError: if input_array is empty
+    Example:
+        >>> find_most_frequent_value(np.array([3, 1, 3, 2, 2, 3]), top_k=2)
+        (array([3, 2]), array([3, 2]))
     """
-    values, counts = np.unique(input_array, return_counts=True)
+    if not hasattr(input_array, "dtype"):  # e.g. lists
+        input_array = np.asanyarray(input_array)
+    if int(np.prod(input_array.shape)) == 0:
+        raise ValueError("Cannot find the most frequent value of an empty array")
+
+    if axis is None:
+        values, counts = _count_values(input_array)
+        if top_k is None:
+            most_frequent_value = values[np.argmax(counts)]  # extract the most frequent element
+            return most_frequent_value
+        idxs_top = np.argsort(-counts, kind="stable")[:top_k]  # stable: ties go to the smallest value
+        return values[idxs_top], counts[idxs_top]
 
-    idx = np.argmax(counts)
-    most_frequent_value = values[idx]  # extract the most frequent element
+    input_array = np.asanyarray(input_array)
+    reduced_axes = tuple(ax % input_array.ndim for ax in (axis if isinstance(axis, tuple) else (axis,)))
+    kept_axes = tuple(ax for ax in range(input_array.ndim) if ax not in reduced_axes)
+    kept_shape = tuple(input_array.shape[ax] for ax in kept_axes)
+    rows = input_array.transpose(kept_axes + reduced_axes).reshape(int(np.prod(kept_shape)), -1)  # one row per output element
 
-    return most_frequent_value
+    values, counts = _most_frequent_values_along_rows(rows, 1 if top_k is None else top_k)
+    if top_k is None:
+        most_frequent_values = values[:, 0].reshape(kept_shape)
+        return most_frequent_values
+
+    return values.reshape(kept_shape + (top_k,)), counts.reshape(kept_shape + (top_k,))
     
     
+def _iter_array_chunks(input_array: Any, chunk_size: int) -> Iterator[np.ndarray]:
+    """This function yields the input array in chunks of roughly chunk_size elements, without copying it when possible
+    Args:
+        input_array (np.ndarray): input array; objects that are not in RAM but support shape and slicing (e.g. a
+            memory-mapped or a lazily loaded volume) are read one slab at a time along their last axis
+        chunk_size (int): approximate number of elements per chunk
+    Returns:
+        chunks (Iterator[np.ndarray]): chunks that together contain all the elements of input_array
+    """
+    if isinstance(input_array, np.ndarray):
+        if input_array.flags.c_contiguous or input_array.flags.f_contiguous:
+            flat_array = input_array.ravel(order="K")  # view, no copy
+            for start_idx in range(0, flat_array.size, chunk_size):
+                yield flat_array[start_idx:start_idx + chunk_size]
+        else:  # ravel would copy the whole array, so we go one slab of the first axis at a time
+            nb_rows = max(1, chunk_size // max(1, input_array[0].size))
+            for start_idx in range(0, input_array.shape[0], nb_rows):
+                yield input_array[start_idx:start_idx + nb_rows]
+    elif hasattr(input_array, "shape") and hasattr(input_array, "__getitem__") and len(input_array.shape) > 0:
+        shape = tuple(input_array.shape)
+        nb_slices = max(1, chunk_size // max(1, int(np.prod(shape[:-1]))))
+        for start_idx in range(0, shape[-1], nb_slices):
+            yield np.asanyarray(input_array[..., start_idx:start_idx + nb_slices])
+    else:  # e.g. lists
+        yield np.asanyarray(input_array)
+
+
+def validate_array(input_array: np.ndarray,
+                   checks: Sequence[str] = ARRAY_CHECKS,
+                   low: float = None,
+                   high: float = None,
+                   chunk_size: int = 2 ** 17) -> Dict[str, bool]:
+    """This function computes several properties of the input array in a single pass. The array is scanned in chunks,
+    so the scratch memory is bounded by chunk_size, and the scan stops as soon as the outcome of all checks is known.
+    Args:
+        input_array (np.ndarray): input array that we want to inspect
+        checks (Sequence[str]): properties to compute, among:
+            "has_nans": True if input_array contains nans
+            "has_infs": True if input_array contains +inf or -inf
+            "is_binary": True if input_array only contains 0s and 1s
+            "all_in_range": True if all values of input_array lie within the open range (low, high); nans are out of range
+            Defaults to all of them
+        low (float): lower bound; only needed for "all_in_range"
+        high (float): upper bound; only needed for "all_in_range"
+        chunk_size (int): number of elements processed at once; defaults to 2**17
+    Returns:
+        results (Dict[str, bool]): it maps each requested check to its outcome
+    Raises:
+        ValueError: if an unknown check is requested, or if "all_in_range" is requested without low and high
+    Example:
+        >>> validate_array(np.array([0., 1., np.nan]), checks=("has_nans", "is_binary"))
+        {'has_nans': True, 'is_binary': False}
+    """
+    unknown_checks = [check for check in checks if check not in ARRAY_CHECKS]
+    if unknown_checks:
+        raise ValueError("Unknown checks {}; valid checks are {}".format(unknown_checks, ARRAY_CHECKS))
+    if "all_in_range" in checks and (low is None or high is None):
+        raise ValueError("low and high must be specified for the check 'all_in_range'")
+
+    default_results = {"has_nans": False, "has_infs": False, "is_binary": True, "all_in_range": True}  # outcomes for an empty array
+    results = {check: default_results[check] for check in checks}
+    undecided_checks = set(checks)
+    if hasattr(input_array, "dtype") and not np.issubdtype(input_array.dtype, np.inexact):  # integers and bools can't be nan/inf
+        undecided_checks -= {"has_nans", "has_infs"}
+
+    for chunk in _iter_array_chunks(input_array, chunk_size):
+        if not undecided_checks:  # we already know all the answers
+            break
+        if chunk.size == 0:
+            continue
+        is_inexact = np.issubdtype(chunk.dtype, np.inexact)
+
+        if np.iscomplexobj(chunk):  # min/max are not meaningful for complex numbers, so we use masks
+            chunk_outcomes = {"has_nans": bool(np.isnan(chunk).any()),
+                              "has_infs": bool(np.isinf(chunk).any()),
+                              "is_binary": bool(np.all((chunk == 0) | (chunk == 1))),
+                              "all_in_range": bool(np.all((chunk.imag == 0) & (chunk.real > low) & (chunk.real < high))) if low is not None and high is not None else True}
+        else:
+            chunk_min = chunk.min()  # np.min and np.max propagate nans, so they also tell us whether the chunk has nans
+            chunk_max = chunk.max()
+            chunk_has_nans = bool(is_inexact and np.isnan(chunk_min))
+            chunk_outcomes = {"has_nans": chunk_has_nans}
+            if "has_infs" in undecided_checks:
+                if chunk_has_nans:  # the nan hides the extremes
+                    chunk_outcomes["has_infs"] = bool(np.isinf(chunk).any())
+                else:
+                    chunk_outcomes["has_infs"] = bool(is_inexact and (np.isinf(chunk_min) or np.isinf(chunk_max)))
+            if "all_in_range" in undecided_checks:
+                chunk_outcomes["all_in_range"] = bool(chunk_min > low and chunk_max < high)  # False if the chunk has nans
+            if "is_binary" in undecided_checks:
+                if chunk_has_nans or chunk_min < 0 or chunk_max > 1:
+                    chunk_outcomes["is_binary"] = False
+                elif is_inexact:  # values such as 0.5 lie within [0, 1] too
+                    chunk_outcomes["is_binary"] = bool(np.all((chunk == 0) | (chunk == 1)))
+                else:
+                    chunk_outcomes["is_binary"] = True
+
+        for check in list(undecided_checks):
+            if chunk_outcomes[check] != default_results[check]:  # one chunk is enough to decide this check
+                results[check] = chunk_outcomes[check]
+                undecided_checks.discard(check)
+
+    return results
+
+
 def has_nans(input_array: np.ndarray) -> bool:
     """"This function checks whether the input array contains any nan.
     If yes, it returns True, otherwise it returns False.
@@ -25,8 +272,7 @@ def has_nans(input_array: np.ndarray) -> bool:
     Returns:
         array_has_nan (bool): True if input_array contains nans; False otherwise
     """
-    array_sum = np.sum(input_array)
-    array_has_nan = np.isnan(array_sum)
+    array_has_nan = validate_array(input_array, checks=("has_nans",))["has_nans"]
     
     return array_has_nan
 
@@ -39,7 +285,7 @@ def is_binary(input_array: np.ndarray) -> bool:
     Returns:
         array_is_binary (bool): True if input_array is binary; False otherwise
     """
-    array_is_binary = np.array_equal(input_array, input_array.astype(bool))
+    array_is_binary = validate_array(input_array, checks=("is_binary",))["is_binary"]
     
     return array_is_binary
     
@@ -54,17 +300,109 @@ def has_values_all_in_range(input_array: np.ndarray, low: int, high: int) -> boo
     Returns:
         array_is_withing_range (bool): True if input_array has values in range (low, high); False otherwise
     """
-    mask_array_bool = (input_array > low) & (input_array < high)
-        
-    if False in mask_array_bool:  # if there is just one False value
-        array_is_withing_range = False
-    else:  # if instead all values are True
-        array_is_withing_range = True
+    array_is_withing_range = validate_array(input_array, checks=("all_in_range",), low=low, high=high)["all_in_range"]
             
     return array_is_withing_range
 
+def _copy_with_offsets(input_batch: np.ndarray, out: np.ndarray, offsets: Sequence[int], fill_value: Any = 0) -> np.ndarray:
+    """This function copies each image of input_batch into out, shifted by offsets along each spatial axis; the parts of out
+    that are not covered by the input images are set to fill_value, and the parts of the input images that fall outside of out are dropped
+    Args:
+        input_batch (np.ndarray): stack of images with shape (B, *spatial_shape)
+        out (np.ndarray): output stack with shape (B, *target_spatial_shape)
+        offsets (Sequence[int]): position in out of the first voxel of each input image, for each spatial axis; negative
+            offsets crop the input images
+        fill_value (Any): value of the voxels of out that are not covered by the input images
+    Returns:
+        out (np.ndarray): same as input, filled with the shifted images
+    """
+    input_idxs, out_idxs = [slice(None)], [slice(None)]  # the batch axis is copied as is
+    for axis, offset in enumerate(offsets, start=1):
+        input_start = max(0, -offset)
+        input_stop = max(input_start, min(input_batch.shape[axis], out.shape[axis] - offset))
+        input_idxs.append(slice(input_start, input_stop))
+        out_idxs.append(slice(input_start + offset, input_stop + offset))
+        if input_start + offset > 0 or input_stop + offset < out.shape[axis]:  # fill only the borders along this axis
+            border_idxs = [slice(None)] * out.ndim
+            border_idxs[axis] = slice(0, input_start + offset)
+            out[tuple(border_idxs)] = fill_value
+            border_idxs[axis] = slice(input_stop + offset, None)
+            out[tuple(border_idxs)] = fill_value
+    out[tuple(out_idxs)] = input_batch[tuple(input_idxs)]
+
+    return out
+
+
+def center_pad_or_crop_batch(input_batch: np.ndarray,
+                             target_shape: Sequence[int],
+                             out: np.ndarray = None,
+                             fill_value: Any = 0) -> Tuple[np.ndarray, Tuple[int, ...]]:
+    """This function center-pads or center-crops a stack of N-D images to target_shape (each spatial axis is padded
+    if it's smaller than the target and cropped if it's larger). All images are written into one output buffer
+    Args:
+        input_batch (np.ndarray): stack of images with shape (B, H, W[, D, ...])
+        target_shape (Sequence[int]): desired spatial shape (H', W'[, D', ...])
+        out (np.ndarray): optional preallocated buffer with shape (B, *target_shape), e.g. to reuse memory across batches;
+            if None (default), a new array with the dtype of input_batch is allocated
+        fill_value (Any): value used for padding; defaults to 0
+    Returns:
+        out (np.ndarray): padded/cropped stack with shape (B, *target_shape)
+        offsets (Tuple[int, ...]): position of the input images in the output, for each spatial axis (positive for
+            padding, negative for cropping); use it with undo_center_pad_or_crop_batch to invert the operation
+    Raises:
+        ValueError: if target_shape does not match the number of spatial axes, or if out has the wrong shape
+    Example:
+        >>> out, offsets = center_pad_or_crop_batch(np.ones((8, 5, 7)), (6, 6))
+        >>> out.shape, offsets
+        ((8, 6, 6), (0, 0))
+    """
+    target_shape = tuple(int(dim) for dim in target_shape)
+    if len(target_shape) != input_batch.ndim - 1:
+        raise ValueError("target_shape must have {} dims (one per spatial axis); got {}".format(input_batch.ndim - 1, target_shape))
+    out_shape = (input_batch.shape[0],) + target_shape
+    if out is None:
+        out = np.empty(out_shape, dtype=input_batch.dtype)
+    elif out.shape != out_shape:
+        raise ValueError("out must have shape {}; got {}".format(out_shape, out.shape))
+
+    # same convention as pad_image_to_specified_shape: the extra voxel (odd difference) goes after the image
+    offsets = tuple((target_dim - input_dim) // 2 if target_dim >= input_dim else -((input_dim - target_dim) // 2)
+                    for input_dim, target_dim in zip(input_batch.shape[1:], target_shape))
+    out = _copy_with_offsets(input_batch, out, offsets, fill_value)
+
+    return out, offsets
+
+
+def undo_center_pad_or_crop_batch(input_batch: np.ndarray,
+                                  original_shape: Sequence[int],
+                                  offsets: Sequence[int],
+                                  out: np.ndarray = None,
+                                  fill_value: Any = 0) -> np.ndarray:
+    """This function inverts center_pad_or_crop_batch; the voxels that were cropped out are set to fill_value
+    Args:
+        input_batch (np.ndarray): stack of padded/cropped images with shape (B, *target_shape)
+        original_shape (Sequence[int]): spatial shape of the images before center_pad_or_crop_batch
+        offsets (Sequence[int]): offsets returned by center_pad_or_crop_batch
+        out (np.ndarray): optional preallocated buffer with shape (B, *original_shape)
+        fill_value (Any): value used for the voxels that were cropped out; defaults to 0
+    Returns:
+        out (np.ndarray): stack of images with shape (B, *original_shape)
+    Raises:
+        ValueError: if out has the wrong shape
+    """
+    out_shape = (input_batch.shape[0],) + tuple(int(dim) for dim in original_shape)
+    if out is None:
+        out = np.empty(out_shape, dtype=input_batch.dtype)
+    elif out.shape != out_shape:
+        raise ValueError("out must have shape {}; got {}".format(out_shape, out.shape))
+    out = _copy_with_offsets(input_batch, out, [-offset for offset in offsets], fill_value)
+
+    return out
+
+
 def pad_image_to_specified_shape(input_img: np.ndarray, desired_x_dim: int, desired_y_dim: int) -> np.ndarray:
-    """This function zero-pads input_img up to the specified shape (desired_x_dim, desired_y_dim)
+    """This function zero-pads input_img up to the specified shape (desired_x_dim, desired_y_dim); dimensions that are
+    larger than the desired ones are center-cropped
     Args:
         input_img (np.ndarray): input image that we want to pad
         desired_x_dim (int): desired dimension 1
@@ -74,19 +412,8 @@ def pad_image_to_specified_shape(input_img: np.ndarray, desired_x_dim: int, desi
     """
     
     assert len(input_img.shape) == 2, "This function is intended for 2D arrays"
-    
-    # extract dims of input image
-    h = input_img.shape[0]
-    w = input_img.shape[1]
 
-    # extract padding width (before and after) for rows
-    a = (desired_x_dim - h) // 2
-    aa = desired_x_dim - a - h
-    
-    # extract padding width (before and after) for cols
-    b = (desired_y_dim - w) // 2
-    bb = desired_y_dim - b - w
-    
-    padded_img = np.pad(input_img, pad_width=((a, aa), (b, bb)), mode='constant', constant_values=0)
+    padded_batch, _ = center_pad_or_crop_batch(input_img[np.newaxis], (desired_x_dim, desired_y_dim))
+    padded_img = padded_batch[0]
     
     return padded_img
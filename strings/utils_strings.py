@@ -1,5 +1,38 @@
+import os
+import re
+import mmap
+import locale
+import contextlib
+import functools
+from datetime import datetime
+from typing import Iterable, Iterator, List, Union, Callable, Optional
+import numpy as np
 from dateutil.parser import parse
 
+# explicit formats tried before falling back to dateutil; each regex pre-filter guarantees that, whenever strptime
+# accepts the string, dateutil.parser.parse accepts it too (so the fast path never changes the result of is_date).
+# Bare HHMMSS and YYMMDD are deliberately missing: dateutil does not read all 6-digit strings consistently
+DATE_FORMATS = [(re.compile(r"\d{8}"), "%Y%m%d"),  # DICOM DA
+                (re.compile(r"\d{6}\.\d{1,6}"), "%H%M%S.%f"),  # DICOM TM with fractional seconds
+                (re.compile(r"\d{14}"), "%Y%m%d%H%M%S"),  # DICOM DT without fractional seconds
+                (re.compile(r"\d{4}-\d{2}-\d{2}"), "%Y-%m-%d"),  # ISO date
+                (re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}"), "%Y-%m-%dT%H:%M:%S"),  # ISO datetime
+                (re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}"), "%Y-%m-%d %H:%M:%S")]
+_recent_date_formats = list(DATE_FORMATS)  # move-to-front list: the last successful format is tried first
+
+
+class _NonDigitDeleter(dict):
+    """str.translate table that deletes every character for which str.isdigit is False. Characters are classified
+    the first time they are seen and then cached in the dict, so translate runs at C speed afterwards"""
+    def __missing__(self, ordinal: int):
+        self[ordinal] = ordinal if chr(ordinal).isdigit() else None
+        return self[ordinal]
+
+
+KEEP_ONLY_DIGITS_TABLE = _NonDigitDeleter()
+_BULK_SEPARATOR = "\x00"
+_KEEP_ONLY_DIGITS_AND_SEPARATOR_TABLE = _NonDigitDeleter({ord(_BULK_SEPARATOR): ord(_BULK_SEPARATOR)})
+
 
 def is_date(input_string: str, fuzzy: bool = False) -> bool:
     """This function checks whether in the input string there is a date
@@ -17,6 +50,58 @@ def is_date(input_string: str, fuzzy: bool = False) -> bool:
     except ValueError:
         return False
 
+
+def _matches_explicit_date_format(input_string: str) -> bool:
+    """This function checks whether input_string matches one of the explicit DATE_FORMATS. Formats are tried from the
+    most recently successful one, since the fields of one column (e.g. a DICOM tag) usually share the same format
+    Args:
+        input_string (str): string to check
+    Returns:
+        True if one of the explicit formats matches; False otherwise (the string might still be a date for dateutil)
+    """
+    for format_idx, (prefilter, date_format) in enumerate(_recent_date_formats):
+        if prefilter.fullmatch(input_string) is None:  # cheap check before the (slower) strptime
+            continue
+        try:
+            datetime.strptime(input_string, date_format)
+        except ValueError:
+            continue
+        if format_idx > 0:
+            _recent_date_formats.insert(0, _recent_date_formats.pop(format_idx))
+        return True
+
+    return False
+
+
+@functools.lru_cache(maxsize=2**16)
+def _is_date_cached(input_string: str, fuzzy: bool) -> bool:
+    """This function is a memoized version of is_date that tries the explicit formats before dateutil"""
+    if _matches_explicit_date_format(input_string):
+        return True
+
+    return is_date(input_string, fuzzy=fuzzy)
+
+
+def detect_dates(input_strings: Iterable[str], fuzzy: bool = False) -> List[bool]:
+    """This function checks, for each input string, whether it can be interpreted as a date. The results are the same
+    as calling is_date on each string, but much faster on large batches (e.g. millions of DICOM or csv fields):
+        - common explicit formats (DICOM YYYYMMDD, HHMMSS.ffffff, YYYYMMDDHHMMSS and ISO) are checked first with a regex
+          pre-filter and strptime, starting from the most recently successful format
+        - dateutil is only used when none of the explicit formats matches
+        - repeated values are memoized with a bounded LRU cache
+    Args:
+        input_strings (Iterable[str]): strings to check; can also be a generator
+        fuzzy (bool): ignore unknown tokens in the strings if True (only used for the dateutil fallback)
+    Returns:
+        dates_found (List[bool]): one bool per input string; True if the string can be interpreted as a date
+    Example:
+        >>> detect_dates(["20230115", "143015.123", "hello", "2023-01-15"])
+        [True, True, False, True]
+    """
+    dates_found = [_is_date_cached(input_string, fuzzy) for input_string in input_strings]
+
+    return dates_found
+
     
 def keep_only_digits(input_string: str) -> str:
     """This function takes as input a string and returns the same string but only containing digits
@@ -25,26 +110,114 @@ def keep_only_digits(input_string: str) -> str:
     Returns:
         output_string (str): the output string that only contains digit characters
     """
-    numeric_filter = filter(str.isdigit, input_string)
-    output_string = "".join(numeric_filter)
+    output_string = input_string.translate(KEEP_ONLY_DIGITS_TABLE)  # same as "".join(filter(str.isdigit, input_string))
     
     return output_string
 
 
-def load_txt_file_as_string(path_txt_file: str) -> str:
-    """This function loads a txt file and returns its content as a string.
+def load_txt_file_as_string(path_txt_file: str, encoding: Optional[str] = None, errors: str = "strict") -> str:
+    """This function loads a txt file and returns its content as a string. For big files (e.g. logs of several GB)
+    use iter_txt_file_chunks, iter_txt_file_lines or find_in_txt_file, whose memory use does not depend on the file size
     Args:
         path_txt_file (str): path to txt file
+        encoding (str): encoding of the file; defaults to None (i.e. the platform default, like open)
+        errors (str): how decoding errors are handled ("strict", "ignore", "replace", ...); defaults to "strict"
     Returns:
         content (str): content of txt file
     """
-    file = open(path_txt_file)
-    content = file.read()
-    file.close()
+    with open(path_txt_file, encoding=encoding, errors=errors) as file:
+        content = file.read()
     
     return content
 
 
+def iter_txt_file_chunks(path_txt_file: str,
+                         chunk_size: int = 2**20,
+                         encoding: Optional[str] = None,
+                         errors: str = "strict") -> Iterator[str]:
+    """This function lazily reads a txt file in chunks of (at most) chunk_size characters. Decoding is incremental,
+    so multi-byte characters are never split between two chunks, and memory use stays bounded by chunk_size
+    Args:
+        path_txt_file (str): path to txt file
+        chunk_size (int): maximum number of characters per chunk; defaults to 2**20
+        encoding (str): encoding of the file; defaults to None (i.e. the platform default, like load_txt_file_as_string)
+        errors (str): how decoding errors are handled ("strict", "ignore", "replace", ...); defaults to "strict"
+    Yields:
+        chunk (str): next chunk of the file
+    """
+    assert chunk_size > 0, "chunk_size must be positive; got {}".format(chunk_size)
+    with open(path_txt_file, encoding=encoding, errors=errors) as file:
+        for chunk in iter(functools.partial(file.read, chunk_size), ""):
+            yield chunk
+
+
+def iter_txt_file_lines(path_txt_file: str,
+                        buffer_size: int = 2**20,
+                        encoding: Optional[str] = None,
+                        errors: str = "strict",
+                        keep_newlines: bool = False) -> Iterator[str]:
+    """This function lazily reads a txt file line by line, with a configurable read buffer
+    Args:
+        path_txt_file (str): path to txt file
+        buffer_size (int): size (in bytes) of the read buffer; defaults to 2**20
+        encoding (str): encoding of the file; defaults to None (i.e. the platform default, like load_txt_file_as_string)
+        errors (str): how decoding errors are handled ("strict", "ignore", "replace", ...); defaults to "strict"
+        keep_newlines (bool): if True, lines keep their trailing newline; defaults to False
+    Yields:
+        line (str): next line of the file
+    """
+    with open(path_txt_file, encoding=encoding, errors=errors, buffering=buffer_size) as file:
+        for line in file:
+            yield line if keep_newlines else line.rstrip("\r\n")
+
+
+@contextlib.contextmanager
+def mmap_txt_file(path_txt_file: str) -> Iterator[Union[mmap.mmap, bytes]]:
+    """This context manager maps a txt file in memory (read-only). The returned object behaves like a bytes object
+    (find, rfind, slicing, re with bytes patterns) but pages are only loaded by the OS when they are accessed
+    Args:
+        path_txt_file (str): path to txt file
+    Yields:
+        file_view (mmap.mmap or bytes): read-only view of the file content (an empty bytes object for empty files,
+                                        which can't be memory-mapped)
+    Example:
+        >>> with mmap_txt_file("/var/log/job.log") as file_view:
+        ...     first_error_offset = file_view.find(b"ERROR")
+    """
+    with open(path_txt_file, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as file_view:
+            yield file_view
+
+
+def find_in_txt_file(path_txt_file: str,
+                     substring: str,
+                     encoding: Optional[str] = None,
+                     max_matches: Optional[int] = None) -> List[int]:
+    """This function finds the occurrences of substring in a txt file, without loading the file in memory
+    Args:
+        path_txt_file (str): path to txt file
+        substring (str): substring to search
+        encoding (str): encoding of the file, used to encode substring; defaults to None (i.e. the platform default,
+                        like load_txt_file_as_string)
+        max_matches (int): if not None, stop after this many matches; defaults to None
+    Returns:
+        byte_offsets (List[int]): byte offsets (not character offsets) of the (non-overlapping) matches
+    """
+    needle = substring.encode(encoding or locale.getpreferredencoding(False))  # same default as open
+    assert needle, "substring must not be empty"
+    byte_offsets = []  # type: List[int]
+    with mmap_txt_file(path_txt_file) as file_view:
+        offset = file_view.find(needle)
+        while offset != -1 and (max_matches is None or len(byte_offsets) < max_matches):
+            byte_offsets.append(offset)
+            offset = file_view.find(needle, offset + len(needle))
+
+    return byte_offsets
+
+
 def add_leading_zeros(input_string: str, out_len: int) -> str:
     """This function adds leading zeros to the input string. The output string will have length == out_len
     Args:
@@ -74,3 +247,103 @@ def remove_leading_zeros(input_string: str) -> str:
     out_string = input_string.lstrip('0')
     
     return out_string
+
+
+def _keep_only_digits_in_bulk(strings: list) -> list:
+    """This function applies keep_only_digits to a list of strings with a single str.translate call: the strings are
+    joined with a separator that the table keeps, translated at once and split back. This removes the per-string call
+    overhead, which dominates for short strings like subject IDs
+    Args:
+        strings (list): input strings
+    Returns:
+        out_strings (list): strings without the non-digit characters
+    """
+    if not strings:
+        return []
+    joined_strings = _BULK_SEPARATOR.join(strings)
+    if joined_strings.count(_BULK_SEPARATOR) != len(strings) - 1:  # some strings contain the separator: translate them one by one
+        return [string.translate(KEEP_ONLY_DIGITS_TABLE) for string in strings]
+    out_strings = joined_strings.translate(_KEEP_ONLY_DIGITS_AND_SEPARATOR_TABLE).split(_BULK_SEPARATOR)
+
+    return out_strings
+
+
+def _apply_to_string_column(column: Union[list, np.ndarray, "pd.Series"],
+                            list_function: Callable[[list], list],
+                            np_function: Callable[[np.ndarray], np.ndarray]) -> Union[list, np.ndarray, "pd.Series"]:
+    """This function applies one string operation to a whole column with the fastest bulk operation available for its type.
+    Pandas Series go through the list path too, since their .str accessor still calls the string method once per element;
+    like with the .str accessor, missing and non-string values become NaN
+    Args:
+        column (list, np.ndarray or pd.Series): column of strings
+        list_function (Callable): function to apply to lists (and other iterables, which are converted to lists)
+        np_function (Callable): function to apply to numpy string arrays
+    Returns:
+        out_column: new column, of the same type as the input column
+    """
+    if hasattr(column, "str") and hasattr(column, "index"):  # pandas Series (pandas is not a hard dependency)
+        values = column.tolist()
+        try:
+            out_values = list_function(values)
+        except (TypeError, AttributeError):  # missing or non-string values (e.g. NaN or numbers in an object column)
+            is_string = [isinstance(value, str) for value in values]
+            out_values = np.full(len(values), np.nan, dtype=object)
+            out_values[is_string] = list_function([value for value in values if isinstance(value, str)])
+        return type(column)(out_values, index=column.index, name=column.name,
+                            dtype=column.dtype if column.dtype.name == "string" else object)
+    if isinstance(column, np.ndarray):
+        if column.dtype.kind != "U":  # e.g. object arrays loaded from csv files
+            column = column.astype(str)
+        return np_function(column)
+
+    return list_function(column if isinstance(column, list) else list(column))
+
+
+def keep_only_digits_column(column: Union[list, np.ndarray, "pd.Series"]) -> Union[list, np.ndarray, "pd.Series"]:
+    """This function is the column-level version of keep_only_digits: it removes the non-digit characters from all
+    the strings of a list, numpy string array or pandas Series at once
+    Args:
+        column (list, np.ndarray or pd.Series): column of strings (e.g. subject IDs)
+    Returns:
+        out_column (list, np.ndarray or pd.Series): new column, of the same type as the input column
+    Example:
+        >>> keep_only_digits_column(["sub-001", "sub_12a"])
+        ['001', '12']
+    """
+    out_column = _apply_to_string_column(column,
+                                         _keep_only_digits_in_bulk,
+                                         lambda array: np.array(_keep_only_digits_in_bulk(array.ravel().tolist()), dtype=str).reshape(array.shape))
+
+    return out_column
+
+
+def add_leading_zeros_column(column: Union[list, np.ndarray, "pd.Series"], out_len: int) -> Union[list, np.ndarray, "pd.Series"]:
+    """This function is the column-level version of add_leading_zeros
+    Args:
+        column (list, np.ndarray or pd.Series): column of strings
+        out_len (int): length of output strings with leading zeros
+    Returns:
+        out_column (list, np.ndarray or pd.Series): new column, of the same type as the input column
+    Example:
+        >>> add_leading_zeros_column(np.array(["13", "7"]), out_len=4)
+        array(['0013', '0007'], dtype='<U4')
+    """
+    out_column = _apply_to_string_column(column,
+                                         lambda strings: [string.zfill(out_len) for string in strings],
+                                         lambda array: np.char.zfill(array, out_len))
+
+    return out_column
+
+
+def remove_leading_zeros_column(column: Union[list, np.ndarray, "pd.Series"]) -> Union[list, np.ndarray, "pd.Series"]:
+    """This function is the column-level version of remove_leading_zeros
+    Args:
+        column (list, np.ndarray or pd.Series): column of strings
+    Returns:
+        out_column (list, np.ndarray or pd.Series): new column, of the same type as the input column
+    """
+    out_column = _apply_to_string_column(column,
+                                         lambda strings: [string.lstrip("0") for string in strings],
+                                         lambda array: np.char.lstrip(array, "0"))
+
+    return out_column